@@ -65,6 +65,7 @@ class Toplevel1:
 
         self.top = top
         self.che52 = tk.IntVar()
+        self.save_profile = tk.StringVar(value='balanced')
 
         self.Frame_img = tk.Frame(self.top)
         self.Frame_img.place(relx=0.032, rely=0.061, relheight=0.422
@@ -76,6 +77,14 @@ class Toplevel1:
         self.Frame_img.configure(highlightbackground="#d9d9d9")
         self.Frame_img.configure(highlightcolor="black")
 
+        self.Label_img = tk.Label(self.Frame_img)
+        self.Label_img.place(relx=0.0, rely=0.0, relheight=1.0, relwidth=1.0)
+        self.Label_img.configure(background="#242b29")
+        self.Label_img.configure(foreground="#bbc1bd")
+        self.Label_img.configure(font="-family {Lucida Console} -size 9")
+        self.Label_img.bind('<Button-1>', SpyCats_GUI_support.toggle_preview)
+        self.Frame_img.bind('<Configure>', SpyCats_GUI_support.show_preview)
+
         self.Frame_msg = tk.Frame(self.top)
         self.Frame_msg.place(relx=0.47, rely=0.056, relheight=0.298
                 , relwidth=0.492)
@@ -109,6 +118,7 @@ class Toplevel1:
         self.btn_open_image.configure(overrelief="groove")
         self.btn_open_image.configure(pady="0")
         self.btn_open_image.configure(text='''Открыть Изображение''')
+        self.btn_open_image.configure(command=SpyCats_GUI_support.open_image)
 
         self.btn_save_image = tk.Button(self.top)
         self.btn_save_image.place(relx=0.231, rely=0.515, height=44, width=177)
@@ -124,6 +134,7 @@ class Toplevel1:
         self.btn_save_image.configure(overrelief="groove")
         self.btn_save_image.configure(pady="0")
         self.btn_save_image.configure(text='''Сохранить Изображение''')
+        self.btn_save_image.configure(command=SpyCats_GUI_support.save_image)
 
         self.btn_dowload_image = tk.Button(self.top)
         self.btn_dowload_image.place(relx=0.031, rely=0.597, height=44
@@ -231,6 +242,7 @@ class Toplevel1:
         self.btn_encrypt.configure(overrelief="groove")
         self.btn_encrypt.configure(pady="0")
         self.btn_encrypt.configure(text='''Шифровать''')
+        self.btn_encrypt.configure(command=SpyCats_GUI_support.encrypt)
 
         self.btn_decrypt = tk.Button(self.top)
         self.btn_decrypt.place(relx=0.723, rely=0.517, height=44, width=227)
@@ -246,6 +258,7 @@ class Toplevel1:
         self.btn_decrypt.configure(overrelief="groove")
         self.btn_decrypt.configure(pady="0")
         self.btn_decrypt.configure(text='''Расшифровать''')
+        self.btn_decrypt.configure(command=SpyCats_GUI_support.decrypt)
 
         self.btn_gen_key = tk.Button(self.top)
         self.btn_gen_key.place(relx=0.468, rely=0.597, height=43, width=467)
@@ -261,6 +274,7 @@ class Toplevel1:
         self.btn_gen_key.configure(overrelief="groove")
         self.btn_gen_key.configure(pady="0")
         self.btn_gen_key.configure(text='''Сгенерировать случайный ключ''')
+        self.btn_gen_key.configure(command=SpyCats_GUI_support.gen_key)
 
         self.Frame_cmd = tk.Frame(self.top)
         self.Frame_cmd.place(relx=0.032, rely=0.731, relheight=0.24
@@ -272,6 +286,16 @@ class Toplevel1:
         self.Frame_cmd.configure(highlightbackground="#d9d9d9")
         self.Frame_cmd.configure(highlightcolor="black")
 
+        self.Text_cmd = tk.Text(self.Frame_cmd)
+        self.Text_cmd.place(relx=0.0, rely=0.0, relheight=1.0, relwidth=1.0)
+        self.Text_cmd.configure(background="#0a0a0a")
+        self.Text_cmd.configure(foreground="#9fd8a8")
+        self.Text_cmd.configure(font="-family {Lucida Console} -size 9")
+        self.Text_cmd.configure(insertbackground="#9fd8a8")
+        self.Text_cmd.configure(relief="flat")
+        self.Text_cmd.configure(state="disabled")
+        self.Text_cmd.configure(wrap="word")
+
         self.Label1_1_3 = tk.Label(self.top)
         self.Label1_1_3.place(relx=0.033, rely=0.693, height=21, width=159)
         self.Label1_1_3.configure(activebackground="#f9f9f9")
@@ -284,11 +308,32 @@ class Toplevel1:
         self.Label1_1_3.configure(highlightcolor="black")
         self.Label1_1_3.configure(text='''Консоль''')
 
+        self.btn_cancel = tk.Button(self.top)
+        self.btn_cancel.place(relx=0.869, rely=0.689, height=21, width=88)
+        self.btn_cancel.configure(activebackground="#898970")
+        self.btn_cancel.configure(activeforeground="black")
+        self.btn_cancel.configure(background="#37423f")
+        self.btn_cancel.configure(disabledforeground="#a3a3a3")
+        self.btn_cancel.configure(font="-family {Lucida Console} -size 9")
+        self.btn_cancel.configure(foreground="#eaecec")
+        self.btn_cancel.configure(highlightbackground="#d9d9d9")
+        self.btn_cancel.configure(highlightcolor="#788f89")
+        self.btn_cancel.configure(overrelief="groove")
+        self.btn_cancel.configure(pady="0")
+        self.btn_cancel.configure(state="disabled")
+        self.btn_cancel.configure(text='''Отмена''')
+        self.btn_cancel.configure(command=SpyCats_GUI_support.cancel)
+
         self.TSeparator2 = ttk.Separator(self.top)
         self.TSeparator2.place(relx=0.032, rely=0.684,  relwidth=0.937)
 
         self.menubar = tk.Menu(top,font="TkMenuFont",bg=_bgcolor,fg=_fgcolor)
         top.configure(menu = self.menubar)
+        self.menu_save = tk.Menu(self.menubar,tearoff=0,font="TkMenuFont",bg=_bgcolor,fg=_fgcolor)
+        self.menubar.add_cascade(label='Сохранение',menu=self.menu_save)
+        self.menu_save.add_radiobutton(label='Быстрее',variable=self.save_profile,value='fastest')
+        self.menu_save.add_radiobutton(label='Сбалансированно',variable=self.save_profile,value='balanced')
+        self.menu_save.add_radiobutton(label='Меньше файл',variable=self.save_profile,value='smallest')
 
 def start_up():
     SpyCats_GUI_support.main()
@@ -5,24 +5,219 @@
 #  in conjunction with Tcl version 8.6
 #    Nov 18, 2022 12:03:57 AM AEST  platform: Windows NT
 
+import secrets
 import sys
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter.constants import *
 
+from tkinter import filedialog
+
+from PIL import ImageTk
+
 import SpyCats_GUI
+import metrics
+import preview
+import worker
+import writer
+from app import Stega
+
+DEGREE = 2 #сколько младших бит каждого байта картинки занимает сообщение
+POLL_MS = 50 #как часто окно забирает события фоновых задач
+
+_image_path = None #открытая картинка
+_encoded = None #результат шифрования (PIL.Image), ещё не сохранённый
+_worker = None
+
+_previews = None #кэш миниатюр
+_showing = 'cover' #что показано в Frame_img: исходная картинка ('cover') или результат ('encoded')
+_encoded_id = 0 #номер результата шифрования - имя для его миниатюр в кэше
+_wanted_key = None #миниатюра, которую ждёт окно
+_photo = None #ссылка на показанную PhotoImage, иначе Tk её потеряет
 
 def main(*args):
     '''Main entry point for the application.'''
     global root
     root = tk.Tk()
-    root.protocol( 'WM_DELETE_WINDOW' , root.destroy)
+    root.protocol( 'WM_DELETE_WINDOW' , close)
     # Creates a toplevel widget.
-    global _top1, _w1
+    global _top1, _w1, _worker, _previews
     _top1 = root
+    _previews = preview.PreviewCache()
     _w1 = SpyCats_GUI.Toplevel1(_top1)
+    _worker = worker.Worker()
+    root.after(POLL_MS, poll)
     root.mainloop()
 
+def close(*args):
+    _worker.shutdown()
+    _previews.shutdown()
+    root.destroy()
+
+def log(text):
+    '''Выводит строку в консоль окна.'''
+    console = _w1.Text_cmd
+    console.configure(state='normal')
+    console.insert('end', text + '\n')
+    console.see('end')
+    console.configure(state='disabled')
+
+def run(name, func, *args, on_done=None):
+    '''Запускает func в фоне; окно при этом продолжает отвечать.'''
+    if _worker.busy:
+        log('Подождите: ещё выполняется предыдущая задача')
+        return
+    _worker.submit(name, func, *args, on_done=on_done)
+    _w1.btn_cancel.configure(state='normal')
+    log(f'{name}...')
+
+def poll():
+    '''Забирает события фоновых задач и показывает их в консоли. Вызывается через after().'''
+    for kind, task, value in _worker.poll():
+        if kind == 'progress':
+            stage, done, total = value
+            log(f'  {task.name}: {stage}' + (f' {done}/{total}' if total else ''))
+        elif kind == 'done':
+            log(f'{task.name}: готово')
+            if task.on_done is not None:
+                task.on_done(value)
+        elif kind == 'error':
+            log(f'{task.name}: ошибка: {value}')
+        elif kind == 'cancelled':
+            log(f'{task.name}: отменено')
+
+    for key, img, error in _previews.poll():
+        if error is not None:
+            log(f'Не удалось построить миниатюру: {error}')
+        elif key == _wanted_key:
+            _display(img)
+
+    if not _worker.busy:
+        _w1.btn_cancel.configure(state='disabled')
+    root.after(POLL_MS, poll)
+
+def _display(img):
+    global _photo
+    _photo = ImageTk.PhotoImage(img)
+    _w1.Label_img.configure(image=_photo, text='')
+
+def show_preview(*args):
+    '''Показывает в Frame_img миниатюру исходной картинки или результата. Размер округляется
+    до 32 пикселей, чтобы при небольшом изменении окна миниатюра бралась из кэша.'''
+    global _wanted_key
+    if _image_path is None:
+        return
+    size = (max(32, _w1.Frame_img.winfo_width() // 32 * 32), max(32, _w1.Frame_img.winfo_height() // 32 * 32))
+
+    if _showing == 'encoded' and _encoded is not None:
+        _wanted_key, img = _previews.request(_encoded, size, name=('encoded', _encoded_id))
+    else:
+        _wanted_key, img = _previews.request(_image_path, size)
+
+    if img is not None:
+        _display(img)
+    elif _photo is None:
+        _w1.Label_img.configure(text='Загрузка...')
+
+def toggle_preview(*args):
+    '''Переключает Frame_img между исходной картинкой и результатом шифрования.'''
+    global _showing
+    if _encoded is None:
+        return
+    _showing = 'cover' if _showing == 'encoded' else 'encoded'
+    log('Показан ' + ('результат' if _showing == 'encoded' else 'оригинал') + ' (щелчок по картинке - переключить)')
+    show_preview()
+
+def cancel(*args):
+    _worker.cancel_all()
+    log('Отмена...')
+
+def open_image(*args):
+    global _image_path, _encoded, _showing
+    path = filedialog.askopenfilename(title='Открыть изображение',
+            filetypes=[('Изображения', '*.png *.bmp *.tif *.tiff *.ppm'), ('Все файлы', '*.*')])
+    if not path:
+        return
+    _image_path, _encoded, _showing = path, None, 'cover'
+    log(f'Открыто: {path}')
+    show_preview()
+
+def _stega(progress):
+    '''Stega, который сообщает время каждого этапа в консоль окна через очередь событий.'''
+    def sink(kind, name, value):
+        if kind == 'span':
+            progress(f'{name} {value * 1000:.1f} мс')
+        else:
+            progress(f'{name} = {value}')
+    return Stega(progress=progress, metrics=metrics.Metrics(sinks=[sink]))
+
+def _key():
+    '''Ключ из поля ввода, если включена галочка "использовать ключ".'''
+    if not _w1.che52.get():
+        return None
+    return _w1.Entry1.get() or None
+
+def gen_key(*args):
+    _w1.Entry1.delete(0, 'end')
+    _w1.Entry1.insert(0, secrets.token_urlsafe(32))
+    _w1.che52.set(1)
+    log('Сгенерирован новый ключ - сохраните его, без него сообщение не расшифровать')
+
+def _encrypt_job(msg, path, key, progress):
+    return _stega(progress).encrypt_image(msg, DEGREE, path, key=key)
+
+def _encrypted(img):
+    global _encoded, _encoded_id, _showing
+    if img is None:
+        log('Сообщение не помещается в картинку')
+        return
+    _encoded, _showing = img, 'encoded'
+    _encoded_id += 1
+    log('Сообщение зашифровано, сохраните изображение (щелчок по картинке - сравнить с оригиналом)')
+    show_preview()
+
+def encrypt(*args):
+    if _image_path is None:
+        log('Сначала откройте изображение')
+        return
+    msg = _w1.Text_msg.get('1.0', 'end-1c')
+    run('Шифрование', _encrypt_job, msg, _image_path, _key(), on_done=_encrypted)
+
+def _decrypt_job(path, key, progress):
+    return _stega(progress).decrypt(DEGREE, path, key=key)
+
+def _decrypted(msg):
+    if isinstance(msg, bytes):
+        log(f'Извлечено {len(msg)} байт двоичных данных')
+        return
+    _w1.Text_msg.delete('1.0', 'end')
+    _w1.Text_msg.insert('1.0', msg)
+
+def decrypt(*args):
+    if _image_path is None:
+        log('Сначала откройте изображение')
+        return
+    run('Расшифровка', _decrypt_job, _image_path, _key(), on_done=_decrypted)
+
+def _save_job(img, path, profile, progress):
+    progress('сохранение')
+    return writer.save(img, path, profile=profile)
+
+def save_image(*args):
+    if _encoded is None:
+        log('Нечего сохранять: сначала зашифруйте сообщение')
+        return
+    path = filedialog.asksaveasfilename(title='Сохранить изображение', defaultextension='.png',
+            filetypes=[('PNG', '*.png'), ('BMP', '*.bmp'), ('TIFF', '*.tif'), ('WebP без потерь', '*.webp')])
+    if not path:
+        return
+    try: #формат с потерями испортил бы сообщение - отказываем сразу, не запуская задачу
+        writer.check(writer.format_for(path), _encoded.mode)
+    except ValueError as e:
+        log(f'Не сохранено: {e}')
+        return
+    run('Сохранение', _save_job, _encoded, path, _w1.save_profile.get(), on_done=lambda p: log(f'Сохранено: {p}'))
+
 if __name__ == '__main__':
     SpyCats_GUI.start_up()
 
@@ -1,8 +1,25 @@
+import argparse
+import io
+import json
 import os
+import re
+import shutil
+import struct
 import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 from PIL import Image
 
+import cipher
+import compressor
+import layout as layout_module
+import metrics as metrics_module
+import raster
+import scatter
+import writer
+
 
 class Stega():
     """
@@ -19,6 +36,41 @@ class Stega():
         SYMBOLS_TABLE_RUS[sym[0]]=sym[1]
         SYMBOLS_TABLE_ENG[sym[1]]=sym[0]
 
+    DEGREES = (1, 2, 4, 8) #допустимые значения degree: байт делится на целое число порций
+
+    # Заголовок перед сообщением: магия, версия, degree, флаги, длина сообщения в байтах, crc32 сообщения
+    MAGIC = b'SPYC'
+    VERSION = 1
+    HEADER = struct.Struct('>4sBBBII')
+    PREFIX_GUESS = 4096 #сколько байтов сообщения декодировать с первой попытки, пока длина ещё неизвестна
+
+    # Тип сообщения - младшие 2 бита флагов заголовка
+    PAYLOAD_LEGACY = 0 #текст по таблице транслитерации (картинки первой версии заголовка)
+    PAYLOAD_TEXT = 1 #текст в UTF-8
+    PAYLOAD_BYTES = 2 #произвольные байты
+    PAYLOAD_MASK = 0b11
+    FLAG_ENCRYPTED = 0b100 #сообщение зашифровано ключом (AES-256-GCM, см. cipher.py)
+    CODEC_SHIFT = 3 #биты 3-4 флагов - кодек сжатия сообщения (compressor.NONE, ZLIB, LZMA, ZSTD)
+    CODEC_MASK = 0b11 << CODEC_SHIFT
+    FLAG_SHARDED = 0b100000 #в картинке одна часть сообщения, разделённого на несколько картинок
+
+    # Заголовок части (после основного): номер сообщения, номер части, число частей,
+    # смещение части в сообщении, длина и crc32 всего сообщения
+    SHARD = struct.Struct('>16sHHQQI')
+
+
+    def __init__(self, progress=None, metrics=None):
+        """progress(stage, done, total) - необязательная функция, которой сообщается ход работы.
+        Исключение из неё прерывает операцию (так GUI отменяет задачи).
+        metrics - metrics.Metrics для замеров времени этапов и счётчиков; без него замеры выключены"""
+        self.progress = progress
+        self.metrics = metrics or metrics_module.NULL
+
+
+    def __report(self, stage, done=None, total=None):
+        if self.progress is not None:
+            self.progress(stage, done, total)
+
 
     def __create_mask(self, degree):
         """Возвращает битовые маски для текста и для картинки"""
@@ -50,136 +102,1258 @@ class Stega():
 
             res.append(word)
         new = " ".join(res)
-        return f'{new}×'
+        return new
+
+
+    def __encode_legacy(self, msg):
+        """Переводит сообщение в байты по таблице транслитерации: кириллица между '@' и '$'
+        записывается латинскими символами из SYMBOLS_TABLE_ENG"""
+
+        cyrillic_flag = False
+        codes = []
+
+        for sym in self.__convert_msg(msg): #добавляем спец символы к исходному сообщению
+
+            if sym == '@': cyrillic_flag=True #проверка на кириллицу
+            if sym == '$': cyrillic_flag=False #проверка на кириллицу
+
+            if cyrillic_flag:
+                sym = Stega.SYMBOLS_TABLE_ENG.get(sym, sym)
+
+            codes.append(ord(sym) & 0xFF) #в картинку попадают только младшие 8 бит символа
+
+        return np.array(codes, dtype=np.uint8)
+
+
+    def __decode_legacy(self, data):
+        """Обратное преобразование для __encode_legacy"""
+
+        cyrillic_flag = False
+        msg = []
+
+        for sym in data.tobytes().decode('latin-1'):
+
+            if sym == '@': #проверка на кириллицу
+                cyrillic_flag=True
+                continue
+
+            if sym == '$': #проверка на кириллицу
+                cyrillic_flag=False
+                continue
+
+            if cyrillic_flag:
+                sym = Stega.SYMBOLS_TABLE_RUS.get(sym, sym)
+
+            msg.append(sym)
+
+        return ''.join(msg)
+
+    def __get_bytes(self, img):
+        """Возвращает плоский массив отсчётов изображения в порядке обхода: строка за строкой, пиксель за пикселем,
+        каналы в порядке режима. L, LA, RGB, RGBA и 16-битные картинки берутся как есть (без лишней копии),
+        остальные приводятся к ближайшему из этих режимов"""
+
+        mode = layout_module.native_mode(img.mode, img.info)
+        if img.mode != mode:
+            img = img.convert(mode)
+
+        return np.array(img).reshape(-1)
+
+
+    def __layout(self, img, degree, channels=None):
+        """Раскладка сообщения по каналам картинки img (см. layout.Layout)"""
+        return layout_module.Layout(layout_module.native_mode(img.mode, img.info), degree, channels)
+
+
+    def __split_bytes(self, data, degree):
+        """Разбивает байты сообщения на порции по degree бит, начиная со старших.
+        На каждый байт приходится int(8/degree) порций"""
+
+        text_mask = self.__create_mask(degree)[0]
+        shifts = np.arange(int(8/degree), dtype=np.uint8) * degree
+
+        chunks = (data[:, None] << shifts) & text_mask #сдвигаем очередные биты на место старших и стираем остальные
+        chunks >>= (8 - degree) #сдвигаем старшие биты на конец
+
+        return chunks.reshape(-1)
+
+
+    def __join_chunks(self, chunks, degree):
+        """Собирает байты обратно из порций по degree бит"""
+
+        steps = int(8/degree)
+        shifts = (np.arange(steps - 1, -1, -1) * degree).astype(np.uint8)
+
+        chunks = chunks[:len(chunks) // steps * steps].reshape(-1, steps)
+        return np.bitwise_or.reduce(chunks << shifts, axis=1).astype(np.uint8)
+
+
+    def __embed(self, flat, data, degree, index=None, layout=None):
+        """Записывает байты data в младшие degree бит байтов изображения flat (на месте).
+        index - номера ячеек для каждой порции (при шифровании с ключом), layout - раскладка по каналам"""
+
+        self.__write_chunks(flat, self.__split_bytes(data, degree), degree, index, layout)
+
+
+    def __write_chunks(self, flat, chunks, degree, index=None, layout=None):
+        """Записывает готовые порции по degree бит в первые ячейки flat или в ячейки index (на месте).
+        Без layout (или если раскладка тождественная) ячейка - это просто отсчёт flat"""
+
+        full = np.iinfo(flat.dtype).max #маска считается в типе отсчётов: у 16-битных картинок старший байт не трогаем
+        img_mask = flat.dtype.type(full & self.__create_mask(degree)[1] | full & ~0xFF)
+
+        if layout is not None and not layout.identity:
+            slots = np.arange(len(chunks)) if index is None else index
+            index, shift = layout.locate(slots)
+
+            if shift is not None: #в одном отсчёте несколько ячеек: пишем по сдвигам, чтобы позиции не повторялись
+                chunks = chunks.astype(flat.dtype)
+                for value in np.unique(shift).tolist():
+                    part = shift == value
+                    positions = index[part]
+                    keep = flat.dtype.type(full ^ (((1 << degree) - 1) << value))
+                    flat[positions] = (flat[positions] & keep) | (chunks[part] << value)
+                return
+
+        if index is not None: #одна операция выборки и одна записи по массиву позиций
+            flat[index] = (flat[index] & img_mask) | chunks
+            return
+
+        carrier = flat[:len(chunks)]
+        carrier &= img_mask #стираем последние биты изображения с помощью маски
+        carrier |= chunks #записываем на их место биты сообщения
+
+
+    def __extract(self, flat, degree, start, count, index=None, layout=None):
+        """Читает count байтов, начиная с байта сообщения start (из ячеек index, если он задан)"""
+
+        steps = int(8/degree)
+        part = slice(start * steps, (start + count) * steps)
+
+        if index is None and (layout is None or layout.identity): #сообщение лежит подряд: срез без выборки по индексам
+            chunks = (flat[part] & (~ self.__create_mask(degree)[1] & 0xFF)).astype(np.uint8, copy=False)
+        else:
+            chunks = self.__read_chunks(flat, degree, np.arange(part.start, part.stop) if index is None else index[part], layout)
+
+        return self.__join_chunks(chunks, degree)
+
+
+    def __read_chunks(self, flat, degree, slots, layout=None):
+        """Порции по degree бит, записанные в ячейки slots байтов изображения flat"""
+
+        img_mask = ~ self.__create_mask(degree)[1] & 0xFF #обратная маска
+
+        if layout is not None and not layout.identity:
+            positions, shift = layout.locate(slots)
+            values = flat[positions]
+            chunks = (values if shift is None else values >> shift) & img_mask
+        else:
+            chunks = flat[slots] & img_mask
+
+        return chunks.astype(np.uint8, copy=False)
+
+
+    def __scatter(self, key, carriers, nbytes, degree):
+        """Позиции байтов картинки для первых nbytes байтов сообщения при шифровании с ключом"""
+
+        with self.metrics.span('scatter'):
+            return scatter.positions(key, carriers, nbytes * int(8/degree))
+
+
+
+    def __pack_header(self, degree, flags, data):
+        """Собирает заголовок для сообщения data"""
+        header = Stega.HEADER.pack(Stega.MAGIC, Stega.VERSION, degree, flags,
+                                   len(data), zlib.crc32(data))
+        return np.frombuffer(header, dtype=np.uint8)
+
+
+    def __read_header(self, flat, degree, carriers, index=None, layout=None):
+        """Читает и проверяет заголовок. Возвращает (flags, длина, crc32).
+        flat - байты каналов начала картинки, carriers - сколько ячеек во всей картинке.
+        Картинки без сообщения отбрасываются уже на первых байтах"""
+
+        if carriers // int(8/degree) < Stega.HEADER.size:
+            raise ValueError('сообщение не найдено: картинка слишком маленькая')
+
+        return self.__check_header(self.__extract(flat, degree, 0, Stega.HEADER.size, index, layout), degree, carriers)
+
 
-    def __get_pixel(self, img):
-        """Генератор, возвращает значение байта пикселя, координаты пикселя + порядок байта (0-r, 1-g, 2-b): 
-        123, [2, 43], 0"""
+    def __check_header(self, header, degree, carriers):
+        """Разбирает и проверяет уже извлечённые байты заголовка. Возвращает (flags, длина, crc32)"""
 
-        pix = img.load() #список всех пикселей изображения. При обращении по координатам возвращает значение трех байтов
-                        # указанного пикселя(RGB компоненты)
+        total = carriers // int(8/degree) #сколько байтов сообщения вмещает картинка
+        magic, version, hdr_degree, flags, length, crc = Stega.HEADER.unpack(header.tobytes())
 
-        width = img.size[0]
-        height = img.size[1]
+        if magic != Stega.MAGIC:
+            raise ValueError('сообщение не найдено: нет заголовка SpyCats')
+        if version > Stega.VERSION:
+            raise ValueError(f'неподдерживаемая версия заголовка: {version}')
+        if hdr_degree != degree:
+            raise ValueError(f'сообщение записано с degree={hdr_degree}, а не {degree}')
+        if Stega.HEADER.size + length > total:
+            raise ValueError('повреждённый заголовок: длина сообщения больше вместимости картинки')
 
-        for y in range(height):
-            for x in range(width):
-                for id in range(0, 3):
-                    yield pix[x,y][id], [x, y], id
+        return flags, length, crc
 
 
 
-    def encrypt(self, msg, degree, pic):
+    def __payload_source(self, msg):
+        """Возвращает (тип сообщения, длина, файловый объект с сообщением).
+        str кодируется в UTF-8, bytes и файлы, открытые в режиме 'rb', берутся как есть.
+        Файл с известной длиной потом читается по частям, а не целиком"""
+
+        if isinstance(msg, str):
+            msg = msg.encode('utf-8')
+            kind = Stega.PAYLOAD_TEXT
+        else:
+            kind = Stega.PAYLOAD_BYTES
+
+        if hasattr(msg, 'read'):
+            try:
+                start = msg.tell()
+                length = msg.seek(0, io.SEEK_END) - start
+                msg.seek(start)
+            except (AttributeError, OSError): #поток без перемотки читаем целиком
+                msg = msg.read()
+            else:
+                return kind, length, msg
+
+        return kind, len(msg), io.BytesIO(msg)
+
+
+    def __build_payload(self, msg, key=None, compress='auto', reserve=0):
+        """Готовит сообщение к встраиванию. Возвращает (флаги заголовка, массив), где первые reserve байтов
+        массива оставлены под заголовки. Сообщение сжимается (если это помогает), а с ключом ещё и шифруется
+        по частям прямо в этот массив, так что большой файл не хранится в памяти дважды"""
+
+        kind, length, source = self.__payload_source(msg)
+        flags = kind
+
+        if compress not in (None, 'none'):
+            start = source.tell()
+            with self.metrics.span('compress'):
+                codec, packed = compressor.compress(source.read, length, compress)
+
+            if packed is None: #сжатие не помогло - берём сообщение как есть
+                source.seek(start)
+            else:
+                self.metrics.count('bytes_saved_by_compression', length - len(packed))
+                source, length = io.BytesIO(packed), len(packed)
+                flags |= codec << Stega.CODEC_SHIFT
+
+        if key is None:
+            data = np.empty(reserve + length, dtype=np.uint8)
+            if source.readinto(data[reserve:]) != length:
+                raise ValueError('сообщение оказалось короче заявленной длины')
+        else:
+            data = np.empty(reserve + cipher.sealed_size(length), dtype=np.uint8)
+            flags |= Stega.FLAG_ENCRYPTED
+
+            self.__report('шифрование')
+            with self.metrics.span('cipher'):
+                cipher.seal(key, source.read, length, data[reserve:])
+
+        return flags, data
+
+
+    def __with_header(self, msg, degree, key=None, compress='auto'):
+        """Заголовок и сообщение одним массивом"""
+
+        flags, data = self.__build_payload(msg, key, compress, Stega.HEADER.size)
+        data[:Stega.HEADER.size] = self.__pack_header(degree, flags, data[Stega.HEADER.size:])
+        return data
+
+
+    def __decode_payload(self, kind, data):
+        """Обратное преобразование для __payload_source"""
+
+        if kind == Stega.PAYLOAD_TEXT:
+            return data.tobytes().decode('utf-8')
+        if kind == Stega.PAYLOAD_BYTES:
+            return data.tobytes()
+        if kind == Stega.PAYLOAD_LEGACY:
+            return self.__decode_legacy(data)
+
+        raise ValueError(f'неизвестный тип сообщения: {kind}')
+
+
+
+    def __open(self, pic):
+        """Открывает картинку из пути, bytes или файлового объекта; уже открытый PIL.Image возвращается как есть.
+        Пиксели не декодируются до первого обращения к ним"""
+
+        if isinstance(pic, Image.Image):
+            return pic
+        if isinstance(pic, (bytes, bytearray, memoryview)):
+            pic = io.BytesIO(pic)
+
+        return Image.open(pic)
+
+
+    def __release(self, img, pic, start=None):
+        """Закрывает картинку, открытую __open по пути или из bytes. Файловый объект вызывающего
+        не закрывается, а возвращается в позицию start, чтобы его можно было прочитать снова"""
+
+        if img is pic:
+            return
+        if start is not None:
+            pic.seek(start)
+        else:
+            img.close()
+
+
+    def __save(self, img, out, format=None, compress_level=None, profile='balanced'):
+        """Сохраняет картинку в путь или файловый объект через writer. Без format в файловый объект пишется PNG"""
+
+        params = {}
+        if compress_level is not None:
+            params['compress_level'] = compress_level
+
+        writer.save(img, out, format, profile, **params)
+
+
+    def __count_embedded(self, nbytes, degree, slots=3, index=None):
+        """
+        Счётчики для метрик: записанные байты (с заголовком) и затронутые пиксели (slots ячеек на пиксель).
+        index - номера занятых ячеек, если сообщение разбросано ключом; без него ячейки идут подряд с начала
+        """
+        if self.metrics.enabled:
+            self.metrics.count('bytes_embedded', nbytes)
+            if index is None:
+                self.metrics.count('pixels_touched', -(-nbytes * int(8/degree) // slots))
+            else: #разбросанные ячейки редко попадают в один пиксель
+                self.metrics.count('pixels_touched', len(np.unique(index // slots)))
+
+
+    def capacity(self, pic, degree, channels=None):
+        """
+        Возвращает, сколько бит сообщения (без заголовка) помещается в картинку.
+        pic - путь, bytes, файловый объект или открытый PIL.Image; читается только заголовок файла, пиксели не декодируются.
+        channels - какие каналы и по сколько бит используются (см. layout.Layout); по умолчанию все, кроме альфы
+        """
+
+        if degree not in Stega.DEGREES:
+            raise ValueError(f'degree должен быть одним из {Stega.DEGREES}')
+
+        start = pic.tell() if hasattr(pic, 'read') else None
+        img = self.__open(pic)
+        try:
+            carriers = self.__layout(img, degree, channels).carriers(img.size)
+        finally:
+            self.__release(img, pic, start)
+
+        payload = carriers // int(8/degree) - Stega.HEADER.size
+        return max(payload, 0) * 8
+
+
+    def pick_degree(self, pic, length, channels=None):
         """
-        Функция для шифрования данных в картинку
+        Возвращает наименьший degree, при котором сообщение длиной length байт помещается в картинку,
+        или None, если не помещается ни при каком
         """
 
-        if os.stat(pic).st_size * degree - 54 < len(msg.encode('utf-8'))*8: #проверка на вместимость сообщения в картинку
-            print('MESSAGE TO ENCRYPT TOO BIG, CHOOSE ANOTHER PICTURE OR SMALLER VALUE OF DEGREE')
+        start = pic.tell() if hasattr(pic, 'read') else None
+        img = self.__open(pic)
+
+        try:
+            for degree in Stega.DEGREES:
+                if self.capacity(img, degree, channels) >= length * 8:
+                    return degree
+        finally:
+            self.__release(img, pic, start)
+
+        return None
+
+
+
+    def encrypt_image(self, msg, degree, pic, legacy=False, key=None, compress='auto', channels=None):
+        """
+        Шифрует сообщение и возвращает результат как PIL.Image, ничего не записывая на диск.
+        pic - путь, bytes, файловый объект или открытый PIL.Image (он сам не изменяется).
+        msg - строка, bytes или файл, открытый в режиме 'rb'.
+        key - ключ (строка или bytes): сообщение шифруется AES-256-GCM с ключом из этого пароля,
+        а его биты разбрасываются по картинке в порядке, который задаёт ключ.
+        compress - 'auto' (кодек выбирается сам, короткие и несжимаемые сообщения не сжимаются),
+        'zlib', 'lzma', 'zstd' или None, чтобы не сжимать.
+        channels - каналы и число бит в каждом: 'RGBA', {'R': 2, 'G': 2, 'B': 2, 'A': 1} и т.п. (см. layout.Layout);
+        по умолчанию - все каналы, кроме альфы, по degree бит. L, LA, RGB, RGBA и 16-битные картинки
+        обрабатываются в своём режиме, альфа-канал сохраняется.
+        legacy=True - старый формат без заголовка (только строки), для совместимости со старыми версиями
+        """
+
+        if legacy and key is not None:
+            raise ValueError('старый формат не поддерживает ключ')
+
+        if legacy:
+            data = self.__encode_legacy(msg)
+            data = np.append(data, np.uint8(ord('×'))) #завершающий символ
+        elif degree not in Stega.DEGREES:
+            raise ValueError(f'degree должен быть одним из {Stega.DEGREES}')
+        else:
+            with self.metrics.span('payload'):
+                data = self.__with_header(msg, degree, key, compress)
+
+        return self.__embed_payload(data, degree, pic, key, channels)
+
+
+    def __embed_payload(self, data, degree, pic, key=None, channels=None):
+        """Встраивает готовый массив (заголовок и сообщение) в картинку pic. Возвращает PIL.Image или None"""
+
+        self.__report('открытие')
+        with self.metrics.span('open'):
+            start_img = self.__open(pic) #пиксели ещё не декодированы, известны только размер и режим
+            layout = self.__layout(start_img, degree, channels)
+            carriers = layout.carriers(start_img.size)
+
+        if len(data) * int(8/degree) > carriers: #проверка на вместимость сообщения в картинку
+            print('MESSAGE TO ENCRYPT TOO BIG, CHOOSE ANOTHER PICTURE OR SMALLER VALUE OF DEGREE', file=sys.stderr)
             return None
 
-        start_img = Image.open(pic).convert('RGB')
-        encode_img = start_img.copy()
-        encode_img_pixels = encode_img.load()
-        pixel = self.__get_pixel(start_img) #генератор
+        self.__report('декодирование')
+        with self.metrics.span('decode'):
+            flat = self.__get_bytes(start_img)
 
-        text_mask = self.__create_mask(degree)[0]
-        img_mask = self.__create_mask(degree)[1]
+        index = None if key is None else self.__scatter(key, carriers, len(data), degree)
 
-        cyrillic_flag = False
+        self.__report('встраивание')
+        with self.metrics.span('embed'):
+            self.__embed(flat, data, degree, index, layout)
+        self.__count_embedded(len(data), degree, layout.slots, index)
 
-        msg = self.__convert_msg(msg) #добавляем спец символы к исходному сообщению
-        for sym in msg:
-            
-            if sym == '@': cyrillic_flag=True #проверка на кириллицу
-            if sym == '$': cyrillic_flag=False #проверка на кириллицу
+        return self.__to_image(flat, start_img, layout)
 
-            if cyrillic_flag:
-                sym = Stega.SYMBOLS_TABLE_ENG.get(sym, sym)
 
-            sym = ord(sym) #представление символа в бинарном виде
-            for iter in range(0, int(8/degree)): #количество итераций (сдвигов)
+    def __to_image(self, flat, start_img, layout):
+        """Собирает PIL.Image из отсчётов flat картинки start_img, сохраняя её info"""
+
+        width, height = start_img.size
+        encode_img = Image.fromarray(flat.reshape((height, width) if layout.nbands == 1 else (height, width, layout.nbands)))
+        encode_img.info = dict(start_img.info) #копия: правка info результата не должна менять исходную картинку
+        return encode_img
 
-                img_byte, coords, id = next(pixel) #получаем байт, координаты пикселя и идентификатор RGB
-                x, y = coords[0], coords[1]
-                img_byte &= img_mask #стираем последние биты изображения с помощью маски
-                
-                bits = sym & text_mask #стираем конечные биты сообщения с помощью маски
-                bits >>= (8 - degree) #сдвигаем начальные биты сообщения на конец
 
-                img_byte |= bits #объединяем и получаем конечный зашифрованный бит
-                encoded_rgb = list(encode_img_pixels[x, y]) #преобразуем кортеж в список, т.к. кортеж неизменяемый
-                encoded_rgb[id] = img_byte
-                encode_img_pixels[x, y] = tuple(encoded_rgb) #записываем зашифрованный байт в картинку
+    def encrypt(self, msg, degree, pic, out='pics/encoded.png', legacy=False, format=None, compress_level=None, key=None,
+                compress='auto', channels=None, profile='balanced'):
+        """
+        Функция для шифрования данных в картинку. Результат сохраняется в out (путь или файловый объект),
+        возвращается out. Формат - format или по расширению out, только без потерь (см. writer.LOSSLESS);
+        profile - 'fastest', 'balanced' или 'smallest', compress_level перекрывает уровень сжатия PNG из профиля
+        """
+
+        format = writer.format_for(out, format)
+        start = pic.tell() if hasattr(pic, 'read') else None
+        cover = self.__open(pic) #пиксели не декодируются: для проверки формата нужен только режим
+        try: #формат с потерями или без нужного режима отвергается до встраивания, а не после
+            writer.check(format, layout_module.native_mode(cover.mode, cover.info))
+        except ValueError:
+            self.__release(cover, pic, start)
+            raise
+
+        encode_img = self.encrypt_image(msg, degree, cover, legacy=legacy, key=key, compress=compress, channels=channels)
+        if encode_img is None:
+            return None
+
+        self.__report('сохранение')
+        with self.metrics.span('save'):
+            self.__save(encode_img, out, format, compress_level, profile)
+        return out
 
-                sym <<= degree
-        
-        encode_img.save('pics/encoded.png')
-        
 
-        
-    def decrypt(self, degree, pic):
+    def encrypt_bytes(self, msg, degree, pic, format='PNG', compress_level=None, legacy=False, key=None, compress='auto',
+                      channels=None, profile='balanced'):
         """
-        Расшифровывает содержимое из картинки
+        Шифрует сообщение и возвращает закодированную картинку как bytes - без записи на диск
         """
-        
-        encode_img = Image.open(pic)
-        msg = ''
 
-        img_mask = self.__create_mask(degree)[1] 
-        img_mask = ~ img_mask #операция двоичного отрицания, получаем обратную маску для bmp
+        buf = io.BytesIO()
+        if self.encrypt(msg, degree, pic, out=buf, legacy=legacy, format=format, compress_level=compress_level,
+                        key=key, compress=compress, channels=channels, profile=profile) is None:
+            return None
 
-        cyrillic_flag = False
+        return buf.getvalue()
 
-        encode_pixel = self.__get_pixel(encode_img)
 
-        while True:
-            sym = 0
-            for iter in range(0, int(8/degree)): #количество итераций (сдвигов)
-                enc_byte, coords, id = next(encode_pixel) #получаем байт, координаты пикселя и идентификатор RGB
-                enc_byte &= img_mask #стираем RGB биты изображения с помощью обратной маски
-                
-                sym <<= degree #сдвигаем старые биты влево на степень сдвига (шаг)
-                sym |= enc_byte #на место старых битов ставим биты из шифрованного bmp
 
-            sym = chr(sym)
+    def encrypt_tiled(self, msg, degree, pic, out, band_rows=256, key=None, compress='auto', channels=None):
+        """
+        Шифрует сообщение в большую картинку полосами по band_rows строк. pic - путь к несжатой картинке
+        (BMP, TIFF без сжатия, PPM) в режиме L, RGB или RGBA, результат в том же формате записывается в out
+        (расширение out должно ему соответствовать, профиль сохранения не применяется).
+        Декодируются и перезаписываются только полосы, в которые попадает сообщение,
+        поэтому память зависит от размера полосы, а не картинки
+        """
 
-            if sym == '×': break
-        
-            if sym == '@': #проверка на кириллицу
-                cyrillic_flag=True 
-                continue
+        if degree not in Stega.DEGREES:
+            raise ValueError(f'degree должен быть одним из {Stega.DEGREES}')
 
-            if sym == '$': #проверка на кириллицу
-                cyrillic_flag=False
+        data = self.__with_header(msg, degree, key, compress)
+        chunks = self.__split_bytes(data, degree)
+
+        with raster.RawRaster(pic) as cover:
+            if writer.format_for(out) != cover.format: #файл копируется как есть, поэтому сменить формат нельзя
+                raise ValueError(f'картинка в формате {cover.format} записывается полосами только в тот же формат, '
+                                 f'а out - {writer.format_for(out)}')
+            size = cover.size
+            layout = layout_module.Layout(cover.mode, degree, channels)
+            carriers = layout.carriers(size)
+
+        if len(chunks) > carriers: #проверка на вместимость сообщения в картинку
+            print('MESSAGE TO ENCRYPT TOO BIG, CHOOSE ANOTHER PICTURE OR SMALLER VALUE OF DEGREE', file=sys.stderr)
+            return None
+
+        shutil.copyfile(pic, out) #строки, которые сообщение не затрагивает, просто копируются
+
+        row_len = size[0] * layout.slots #ячеек в строке
+
+        if key is None: #сообщение лежит подряд с начала картинки
+            targets = np.arange(len(chunks))
+        else: #позиции из перестановки сортируются, чтобы обойти полосы по порядку
+            targets = self.__scatter(key, carriers, len(data), degree)
+            order = np.argsort(targets)
+            targets, chunks = targets[order], chunks[order]
+
+        bands = np.unique(targets // (band_rows * row_len)) * band_rows
+
+        with raster.RawRaster(out, writable=True) as encoded:
+            for y0 in bands.tolist(): #обходим только полосы, в которые попадает сообщение
+                y1 = min(y0 + band_rows, size[1])
+                self.__report('полоса', y0, size[1])
+
+                with self.metrics.span('band'):
+                    a, b = np.searchsorted(targets, [y0 * row_len, y1 * row_len])
+                    band = encoded.read_rows(y0, y1)
+                    self.__write_chunks(band.reshape(-1), chunks[a:b], degree, targets[a:b] - y0 * row_len, layout)
+                    encoded.write_rows(y0, band)
+
+        self.__count_embedded(len(data), degree, layout.slots, None if key is None else targets)
+        return out
+
+
+
+    def encrypt_sharded(self, msg, degree, covers, outs, key=None, compress='auto', workers=None,
+                        format=None, compress_level=None, channels=None, profile='balanced'):
+        """
+        Делит сообщение, которое не помещается в одну картинку, на части по картинкам covers
+        (пропорционально их вместимости) и встраивает части параллельно в пуле процессов.
+        Результаты сохраняются в outs (пути, по одному на картинку); возвращается outs.
+        В заголовке каждой части - общий номер сообщения, номер части, их число и место части в сообщении,
+        поэтому decrypt_sharded принимает картинки в любом порядке
+        """
+
+        if degree not in Stega.DEGREES:
+            raise ValueError(f'degree должен быть одним из {Stega.DEGREES}')
+        if len(covers) != len(outs):
+            raise ValueError('картинок и путей для результатов должно быть поровну')
+        if not 0 < len(covers) <= 0xFFFF:
+            raise ValueError('число частей должно быть от 1 до 65535')
+        for out in outs:
+            writer.check(writer.format_for(out, format))
+
+        with self.metrics.span('payload'):
+            flags, payload = self.__build_payload(msg, key, compress)
+
+        room = [] #сколько байтов сообщения помещается в каждую картинку после заголовков
+        for number, cover in enumerate(covers, 1):
+            free = self.capacity(cover, degree, channels) // 8 - Stega.SHARD.size
+            start = cover.tell() if hasattr(cover, 'read') else None
+            img = self.__open(cover)
+            try:
+                writer.check(writer.format_for(outs[number - 1], format), layout_module.native_mode(img.mode, img.info))
+            finally:
+                self.__release(img, cover, start)
+            if free < 0:
+                raise ValueError(f'картинка №{number} слишком маленькая даже для заголовка части')
+            room.append(free)
+
+        if sum(room) < len(payload):
+            print('MESSAGE TO ENCRYPT TOO BIG, CHOOSE ANOTHER PICTURE OR SMALLER VALUE OF DEGREE', file=sys.stderr)
+            return None
+
+        sizes = [len(payload) * free // sum(room) for free in room]
+        for i in range(len(sizes)): #остаток от округления - по байту в картинки, где ещё есть место
+            if sum(sizes) == len(payload):
+                break
+            if sizes[i] < room[i]:
+                sizes[i] += 1
+
+        ident, crc = os.urandom(16), zlib.crc32(payload)
+        jobs, offset = [], 0
+        for number, (cover, out, size) in enumerate(zip(covers, outs, sizes)):
+            manifest = Stega.SHARD.pack(ident, number, len(covers), offset, len(payload), crc)
+            shard = np.concatenate([np.frombuffer(manifest, dtype=np.uint8), payload[offset:offset + size]])
+            data = np.concatenate([self.__pack_header(degree, flags | Stega.FLAG_SHARDED, shard), shard])
+            jobs.append((data, degree, cover, out, key, format, compress_level, channels, profile, self.metrics.enabled))
+            offset += size
+
+        self.__report('встраивание частей')
+        with self.metrics.span('embed'):
+            if workers == 1 or len(jobs) == 1:
+                counters = list(map(_embed_shard, jobs))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    counters = list(pool.map(_embed_shard, jobs))
+
+        for shard in counters: #затронутые пиксели считает процесс, который знает режим картинки и позиции ячеек
+            for name, value in shard.items():
+                self.metrics.count(name, value)
+        return outs
+
+
+    def embed_shard(self, data, degree, pic, out, key=None, format=None, compress_level=None, channels=None,
+                    profile='balanced'):
+        """Встраивает одну часть, подготовленную encrypt_sharded, и сохраняет картинку в out (выполняется в пуле)"""
+
+        encode_img = self.__embed_payload(data, degree, pic, key, channels)
+        if encode_img is None:
+            raise ValueError('часть сообщения не помещается в картинку')
+
+        self.__save(encode_img, out, format, compress_level, profile)
+        return out
+
+
+    def update(self, msg, degree, pic, out=None, key=None, compress=None, channels=None, profile='balanced',
+               band_rows=256):
+        """
+        Заменяет сообщение в картинке, уже зашифрованной с теми же degree, key и channels. Перезаписываются только
+        ячейки, биты которых отличаются от записанных, и заголовок, так что мелкая правка дешевле полного encrypt.
+        pic - путь (или bytes, файловый объект, PIL.Image - тогда нужен out); результат пишется в out, по умолчанию в pic.
+        Несжатые BMP, TIFF и PPM правятся прямо в файле полосами по band_rows строк: читаются только строки
+        с сообщением, записываются только изменённые. Остальные форматы декодируются и сохраняются заново (profile).
+        Если новое сообщение короче старого, хвост старого затирается случайными битами.
+        С ключом сообщение шифруется со случайным nonce и меняется всё целиком; сжатие (compress) тоже сдвигает байты
+        после места правки, поэтому по умолчанию сообщение не сжимается
+        """
+
+        if degree not in Stega.DEGREES:
+            raise ValueError(f'degree должен быть одним из {Stega.DEGREES}')
+
+        if out is None:
+            if not isinstance(pic, (str, os.PathLike)):
+                raise ValueError('картинка не из файла: укажите out')
+            out = pic
+        writer.check(writer.format_for(out)) #формат с потерями отвергается до встраивания, а не после
+
+        with self.metrics.span('payload'):
+            chunks = self.__split_bytes(self.__with_header(msg, degree, key, compress), degree)
+
+        raw = isinstance(pic, (str, os.PathLike)) and isinstance(out, (str, os.PathLike))
+        if raw:
+            try:
+                with raster.RawRaster(pic) as cover:
+                    raw = writer.format_for(out) == cover.format
+            except ValueError: #сжатая картинка - правится через декодирование
+                raw = False
+
+        if raw:
+            changed = self.__update_raw(chunks, degree, pic, out, key, channels, band_rows)
+        else:
+            changed = self.__update_image(chunks, degree, pic, out, key, channels, profile)
+
+        if changed is None:
+            return None
+
+        self.metrics.count('cells_rewritten', changed)
+        return out
+
+
+    def __targets(self, key, carriers, count, degree):
+        """Номера ячеек для count порций сообщения: подряд с начала или в порядке, заданном ключом"""
+        if key is None:
+            return np.arange(count)
+        return self.__scatter(key, carriers, count // int(8/degree), degree)
+
+
+    def __check_previous(self, chunks, degree, carriers):
+        """Проверяет заголовок сообщения, которое уже лежит в картинке, по порциям его ячеек. Возвращает его длину"""
+
+        flags, length = self.__check_header(self.__join_chunks(chunks, degree), degree, carriers)[:2]
+        if flags & Stega.FLAG_SHARDED:
+            raise ValueError('в картинке часть разделённого сообщения: части обновляются только все вместе')
+        return length
+
+
+    def __with_noise(self, chunks, degree, length):
+        """Дополняет порции нового сообщения случайными до конца старого сообщения длины length"""
+
+        tail = (Stega.HEADER.size + length) * int(8/degree) - len(chunks)
+        if tail <= 0:
+            return chunks
+        noise = np.frombuffer(os.urandom(tail), dtype=np.uint8) & ((1 << degree) - 1)
+        return np.concatenate([chunks, noise.astype(chunks.dtype)])
+
+
+    def __update_raw(self, chunks, degree, pic, out, key=None, channels=None, band_rows=256):
+        """Обновление несжатой картинки прямо в файле. Возвращает число перезаписанных ячеек или None"""
+
+        header_cells = Stega.HEADER.size * int(8/degree) #новые порции начинаются с заголовка, их всегда не меньше
+
+        with raster.RawRaster(pic) as cover:
+            size = cover.size
+            layout = layout_module.Layout(cover.mode, degree, channels)
+            carriers = layout.carriers(size)
+            if len(chunks) > carriers: #проверка на вместимость сообщения в картинку
+                print('MESSAGE TO ENCRYPT TOO BIG, CHOOSE ANOTHER PICTURE OR SMALLER VALUE OF DEGREE', file=sys.stderr)
+                return None
+
+            row_len = size[0] * layout.slots #ячеек в строке
+            targets = self.__targets(key, carriers, len(chunks), degree)
+
+            with self.metrics.span('header'): #заголовок читается по строкам, в которые попадают его ячейки
+                head = targets[:header_cells]
+                old = np.empty(header_cells, dtype=np.uint8)
+                for y in np.unique(head // row_len).tolist():
+                    part = head // row_len == y
+                    old[part] = self.__read_chunks(cover.read_rows(y, y + 1).reshape(-1), degree, head[part] - y * row_len, layout)
+                length = self.__check_previous(old, degree, carriers)
+
+            chunks = self.__with_noise(chunks, degree, length) #хвост старого сообщения не должен остаться в картинке
+            if len(chunks) > len(targets):
+                targets = self.__targets(key, carriers, len(chunks), degree)
+
+        if os.path.abspath(out) != os.path.abspath(pic):
+            shutil.copyfile(pic, out)
+
+        if key is not None: #позиции сортируются, чтобы обойти полосы по порядку
+            order = np.argsort(targets)
+            targets, chunks = targets[order], chunks[order]
+
+        changed = 0
+        bands = np.unique(targets // (band_rows * row_len)) * band_rows
+
+        with raster.RawRaster(out, writable=True) as encoded:
+            for y0 in bands.tolist(): #обходим только полосы, в которые попадает сообщение
+                y1 = min(y0 + band_rows, size[1])
+                self.__report('полоса', y0, size[1])
+
+                with self.metrics.span('band'):
+                    a, b = np.searchsorted(targets, [y0 * row_len, y1 * row_len])
+                    band = encoded.read_rows(y0, y1)
+                    flat = band.reshape(-1)
+
+                    cells = targets[a:b] - y0 * row_len
+                    diff = self.__read_chunks(flat, degree, cells, layout) != chunks[a:b]
+                    if not diff.any():
+                        continue
+
+                    self.__write_chunks(flat, chunks[a:b][diff], degree, cells[diff], layout)
+                    rows = cells[diff] // row_len #записываются только строки от первой до последней изменённой
+                    encoded.write_rows(y0 + int(rows[0]), band[rows[0]:rows[-1] + 1])
+                    changed += int(np.count_nonzero(diff))
+
+        return changed
+
+
+    def __update_image(self, chunks, degree, pic, out, key=None, channels=None, profile='balanced'):
+        """Обновление картинки, которую нужно декодировать целиком. Возвращает число перезаписанных ячеек или None"""
+
+        self.__report('декодирование')
+        with self.metrics.span('decode'):
+            start_img = self.__open(pic)
+            writer.check(writer.format_for(out), layout_module.native_mode(start_img.mode, start_img.info))
+            layout = self.__layout(start_img, degree, channels)
+            carriers = layout.carriers(start_img.size)
+
+            if len(chunks) > carriers: #проверка на вместимость сообщения в картинку
+                print('MESSAGE TO ENCRYPT TOO BIG, CHOOSE ANOTHER PICTURE OR SMALLER VALUE OF DEGREE', file=sys.stderr)
+                return None
+
+            flat = self.__get_bytes(start_img)
+
+        targets = self.__targets(key, carriers, len(chunks), degree)
+        header_cells = Stega.HEADER.size * int(8/degree)
+
+        with self.metrics.span('header'):
+            length = self.__check_previous(self.__read_chunks(flat, degree, targets[:header_cells], layout), degree, carriers)
+
+        chunks = self.__with_noise(chunks, degree, length) #хвост старого сообщения не должен остаться в картинке
+        if len(chunks) > len(targets):
+            targets = self.__targets(key, carriers, len(chunks), degree)
+
+        self.__report('встраивание')
+        with self.metrics.span('embed'):
+            diff = self.__read_chunks(flat, degree, targets, layout) != chunks
+            self.__write_chunks(flat, chunks[diff], degree, targets[diff], layout)
+
+        if diff.any() or out is not pic:
+            self.__report('сохранение')
+            with self.metrics.span('save'):
+                self.__save(self.__to_image(flat, start_img, layout), out, profile=profile)
+
+        return int(np.count_nonzero(diff))
+
+
+
+    def decrypt(self, degree, pic, legacy=False, key=None, channels=None):
+        """
+        Расшифровывает содержимое из картинки. Возвращает строку или bytes - в зависимости от того, что было зашифровано.
+        pic - путь, bytes, файловый объект или открытый PIL.Image.
+        key - ключ, с которым сообщение шифровалось; channels - те же каналы, что и при шифровании.
+        legacy=True - для старых картинок без заголовка, где сообщение заканчивается символом '×'
+        """
+
+        if hasattr(pic, 'read'):
+            pic = pic.read() #файл читается один раз, чтобы картинку можно было открыть повторно
+
+        if legacy and key is not None:
+            raise ValueError('старый формат не поддерживает ключ')
+
+        if legacy:
+            img = self.__open(pic)
+            return self.__decrypt_legacy(self.__get_bytes(img), degree, self.__layout(img, degree, channels))
+
+        flags, data = self.__read_payload(degree, pic, key, channels)
+        if flags & Stega.FLAG_SHARDED:
+            raise ValueError('в картинке только часть сообщения: расшифруйте все части через decrypt_sharded')
+
+        return self.__finish_payload(flags, data, key)
+
+
+    def __read_payload(self, degree, pic, key=None, channels=None):
+        """Находит заголовок и извлекает сообщение как есть, без расшифровки и распаковки.
+        Возвращает (флаги заголовка, байты сообщения)"""
+
+        if key is not None: #с ключом биты разбросаны по всей картинке, поэтому она декодируется целиком
+            self.__report('декодирование')
+            with self.metrics.span('decode'):
+                img = self.__open(pic)
+                layout = self.__layout(img, degree, channels)
+                carriers = layout.carriers(img.size)
+                flat = self.__get_bytes(img)
+
+            self.__report('заголовок')
+            with self.metrics.span('header'):
+                index = self.__scatter(key, carriers, Stega.HEADER.size, degree)
+                flags, length, crc = self.__read_header(flat, degree, carriers, index, layout)
+
+            index = self.__scatter(key, carriers, Stega.HEADER.size + length, degree)
+
+            if flags & Stega.FLAG_ENCRYPTED and not flags & Stega.FLAG_SHARDED:
+                #неверный ключ отбрасывается по заголовку шифрования, до чтения сообщения
+                if length < cipher.HEADER.size:
+                    raise ValueError('повреждённый заголовок: сообщение короче заголовка шифрования')
+                with self.metrics.span('header'):
+                    cipher.read_header(key, self.__extract(flat, degree, Stega.HEADER.size, cipher.HEADER.size, index, layout))
+
+        else:
+            index = None
+
+            self.__report('заголовок')
+            with self.metrics.span('header'):
+                flat, carriers, layout = self.__read_prefix(pic, Stega.HEADER.size + Stega.PREFIX_GUESS, degree, channels)
+                flags, length, crc = self.__read_header(flat, degree, carriers, layout=layout)
+
+            if (Stega.HEADER.size + length) * int(8/degree) > len(flat) // layout.nbands * layout.slots:
+                #сообщение длиннее, чем уже декодированные строки
+                self.__report('декодирование')
+                with self.metrics.span('decode'):
+                    flat, carriers, layout = self.__read_prefix(pic, Stega.HEADER.size + length, degree, channels)
+
+        self.__report('извлечение')
+        with self.metrics.span('extract'):
+            data = self.__extract(flat, degree, Stega.HEADER.size, length, index, layout) #читаем ровно length байтов одним срезом
+            if zlib.crc32(data) != crc:
+                raise ValueError('сообщение повреждено: не совпадает контрольная сумма')
+
+        self.metrics.count('bytes_extracted', length)
+        return flags, data
+
+
+    def __finish_payload(self, flags, data, key=None):
+        """Расшифровывает, распаковывает и декодирует извлечённое сообщение"""
+
+        if flags & Stega.FLAG_ENCRYPTED:
+            if key is None:
+                raise ValueError('сообщение зашифровано: нужен ключ')
+            if len(data) < cipher.HEADER.size:
+                raise ValueError('повреждённый заголовок: сообщение короче заголовка шифрования')
+            self.__report('расшифровка')
+            with self.metrics.span('cipher'):
+                sealed = cipher.read_header(key, data[:cipher.HEADER.size]) #ключ из пароля уже в кэше cipher
+                data = cipher.unseal(sealed, data[cipher.HEADER.size:])
+
+        codec = (flags & Stega.CODEC_MASK) >> Stega.CODEC_SHIFT
+        if codec != compressor.NONE:
+            with self.metrics.span('decompress'):
+                data = np.frombuffer(compressor.decompress(codec, data), dtype=np.uint8)
+
+        return self.__decode_payload(flags & Stega.PAYLOAD_MASK, data)
+
+
+    def decrypt_sharded(self, degree, pics, key=None, workers=None, channels=None):
+        """
+        Собирает сообщение из картинок, полученных encrypt_sharded. pics - все части в любом порядке;
+        каждая читается в пуле процессов. Отсутствующие, повторяющиеся или чужие части - ошибка
+        """
+
+        pics = [pic.read() if hasattr(pic, 'read') else pic for pic in pics]
+        jobs = [(degree, pic, key, channels) for pic in pics]
+
+        self.__report('извлечение частей')
+        with self.metrics.span('extract'):
+            if workers == 1 or len(jobs) == 1:
+                shards = list(map(_read_shard, jobs))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    shards = list(pool.map(_read_shard, jobs))
+
+        parts, common = {}, None
+        for flags, data in shards:
+            if not flags & Stega.FLAG_SHARDED or len(data) < Stega.SHARD.size:
+                raise ValueError('картинка не содержит части разделённого сообщения')
+
+            ident, number, count, offset, total, crc = Stega.SHARD.unpack(data[:Stega.SHARD.size].tobytes())
+            if common is None:
+                common = (ident, count, total, crc, flags)
+            elif common != (ident, count, total, crc, flags):
+                raise ValueError('картинки содержат части разных сообщений')
+            if number in parts:
+                raise ValueError(f'часть {number + 1} встречается дважды')
+            parts[number] = (offset, data[Stega.SHARD.size:])
+
+        if common is None:
+            raise ValueError('не передано ни одной картинки')
+
+        ident, count, total, crc, flags = common
+        missing = [number + 1 for number in range(count) if number not in parts]
+        if missing:
+            raise ValueError(f'не хватает частей {missing} из {count}')
+
+        payload = np.empty(total, dtype=np.uint8)
+        pos = 0
+        for number in range(count):
+            offset, part = parts[number]
+            if offset != pos or pos + len(part) > total:
+                raise ValueError('повреждённые заголовки частей: части не стыкуются')
+            payload[pos:pos + len(part)] = part
+            pos += len(part)
+
+        if pos != total or zlib.crc32(payload) != crc:
+            raise ValueError('собранное сообщение повреждено: не совпадает контрольная сумма')
+
+        return self.__finish_payload(flags & ~Stega.FLAG_SHARDED, payload, key)
+
+
+    def read_shard(self, degree, pic, key=None, channels=None):
+        """Извлекает одну часть как есть: (флаги заголовка, байты части). Для decrypt_sharded (выполняется в пуле)"""
+
+        if hasattr(pic, 'read'):
+            pic = pic.read()
+
+        return self.__read_payload(degree, pic, key, channels)
+
+
+    def probe(self, pic, key=None, channels=None):
+        """
+        Ищет заголовок SpyCats при каждом degree, не извлекая сообщение. Без ключа декодируются только строки
+        с заголовком, поэтому чистые картинки отбрасываются быстро. Возвращает список найденных заголовков -
+        словарей с ключами degree, keyed, kind, encrypted, codec, sharded, length (пустой, если сообщения нет).
+        С ключом ищутся и заголовки, разбросанные этим ключом, и обычные - в начале картинки
+        """
+
+        if hasattr(pic, 'read'):
+            pic = pic.read()
+
+        if key is None: #заголовку при degree=1 нужно больше всего ячеек: этих строк хватит для любого degree
+            flat, carriers, base = self.__read_prefix(pic, Stega.HEADER.size, 1, channels)
+        else:
+            img = self.__open(pic)
+            base = self.__layout(img, 1, channels)
+            carriers = base.carriers(img.size)
+            flat = self.__get_bytes(img)
+
+        kinds = {Stega.PAYLOAD_LEGACY: 'legacy', Stega.PAYLOAD_TEXT: 'text', Stega.PAYLOAD_BYTES: 'bytes'}
+        codecs = {number: name for name, number in compressor.NAMES.items()}
+        found = []
+
+        for degree in Stega.DEGREES:
+            try:
+                layout = layout_module.Layout(base.mode, degree, channels)
+            except ValueError: #channels не подходят для этого degree
                 continue
+            total = carriers // base.slots * layout.slots
 
-            if cyrillic_flag:
-                sym = Stega.SYMBOLS_TABLE_RUS.get(sym, sym)
+            for keyed in (False, True) if key is not None else (False,): #с ключом ищем и обычный заголовок в начале
+                try:
+                    index = self.__scatter(key, total, Stega.HEADER.size, degree) if keyed else None
+                    flags, length, crc = self.__read_header(flat, degree, total, index, layout)
+                except ValueError: #нет заголовка
+                    continue
+
+                found.append({'degree': degree, 'keyed': keyed, 'kind': kinds.get(flags & Stega.PAYLOAD_MASK, 'unknown'),
+                              'encrypted': bool(flags & Stega.FLAG_ENCRYPTED),
+                              'codec': codecs.get((flags & Stega.CODEC_MASK) >> Stega.CODEC_SHIFT),
+                              'sharded': bool(flags & Stega.FLAG_SHARDED), 'length': length})
+
+        return found
+
+
+    def __read_prefix(self, pic, count, degree, channels=None):
+        """
+        Декодирует только те строки картинки, в которых лежат первые count байтов сообщения.
+        Возвращает (отсчёты этих строк, число ячеек во всей картинке, раскладка по каналам).
+        Уже открытый PIL.Image не трогаем и берём целиком
+        """
+
+        img = self.__open(pic)
+        layout = self.__layout(img, degree, channels)
+        carriers = layout.carriers(img.size)
+
+        if img is not pic:
+            rows = -(-count * int(8/degree) // (img.size[0] * layout.slots))
+            img = raster.decode_rows(img, rows)
+
+        return self.__get_bytes(img), carriers, layout
+
+
+    def __decrypt_legacy(self, flat, degree, layout=None):
+        """Ищет завершающий символ '×' и расшифровывает всё, что перед ним"""
+
+        carriers = len(flat) if layout is None else len(flat) // layout.nbands * layout.slots
+        total = carriers // int(8/degree) #сколько байтов сообщения вмещает картинка
+        start, block = 0, 4096
+        end = None
+
+        while start < total: #читаем байты блоками, пока не встретим завершающий символ '×'
+            self.__report('поиск', start, total)
+            count = min(block, total - start)
+            syms = self.__extract(flat, degree, start, count, layout=layout)
+
+            found = np.flatnonzero(syms == ord('×'))
+            if len(found):
+                end = start + found[0]
+                break
+
+            start += count
+            block *= 2
+
+        if end is None:
+            raise ValueError('сообщение не найдено: в картинке нет завершающего символа')
+
+        return self.__decode_legacy(self.__extract(flat, degree, 0, end, layout=layout))
+
+
+
+
+
+def _embed_shard(job):
+    """Задача пула для encrypt_sharded. Возвращает счётчики метрик части (пустые, если stats ложно)"""
+    data, degree, pic, out, key, format, compress_level, channels, profile, stats = job
+    inst = Stega(metrics=metrics_module.Metrics() if stats else None)
+    inst.embed_shard(data, degree, pic, out, key, format, compress_level, channels, profile)
+    return inst.metrics.snapshot()['counters'] if stats else {}
+
+
+def _read_shard(job):
+    """Задача пула для decrypt_sharded"""
+    degree, pic, key, channels = job
+    return Stega().read_shard(degree, pic, key, channels)
+
+
+
+def _channels(text):
+    """Каналы из командной строки: 'RGBA' (все по degree бит) или 'R2G2B2A1' (число бит для каждого)"""
+
+    parts = re.findall(r'([A-Za-z])(\d*)', text)
+    if ''.join(band + bits for band, bits in parts) != text:
+        raise argparse.ArgumentTypeError(f'неверное описание каналов: {text}')
+    if not any(bits for _, bits in parts):
+        return text
+    if not all(bits for _, bits in parts):
+        raise argparse.ArgumentTypeError('число бит нужно указать для каждого канала')
+
+    return {band: int(bits) for band, bits in parts}
+
+
+def main(argv=None):
+    """Точка входа командной строки"""
+
+    parser = argparse.ArgumentParser(prog='app.py', description='SpyCats - стеганография в картинках')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--stats', choices=('text', 'prometheus'), help='вывести в stderr время этапов и счётчики')
+    common.add_argument('-k', '--key', help='ключ: сообщение шифруется AES-256-GCM и разбрасывается по картинке в порядке, заданном ключом')
+    common.add_argument('-c', '--channels', type=_channels,
+                        help="каналы для сообщения: 'RGBA' или с числом бит в каждом, например 'R2G2B2A1' (по умолчанию все, кроме альфы)")
+
+    saving = argparse.ArgumentParser(add_help=False)
+    saving.add_argument('--profile', default='balanced', choices=tuple(writer.PROFILES),
+                        help='сохранение результата: fastest - быстрее, smallest - меньше файл')
+
+    enc = commands.add_parser('encrypt', parents=[common, saving], help='зашифровать сообщение в картинку')
+    enc.add_argument('cover', help='исходная картинка')
+    source = enc.add_mutually_exclusive_group(required=True)
+    source.add_argument('-m', '--message', help='текст сообщения')
+    source.add_argument('-f', '--file', help='файл, содержимое которого нужно спрятать')
+    enc.add_argument('-d', '--degree', type=int, default=2, choices=Stega.DEGREES)
+    enc.add_argument('-o', '--out', default='pics/encoded.png', help='куда сохранить результат')
+    enc.add_argument('--band-rows', type=int, help='обрабатывать несжатую картинку полосами по столько строк; '
+                     'результат пишется в том же формате (-o с тем же расширением), --profile не применяется')
+    enc.add_argument('--compress', default='auto', choices=('auto', 'none', 'zlib', 'lzma', 'zstd'),
+                     help='сжатие сообщения (auto - выбрать кодек по пробному сжатию)')
+
+    upd = commands.add_parser('update', parents=[common, saving], help='заменить сообщение в уже зашифрованной картинке')
+    upd.add_argument('image', help='картинка с сообщением')
+    source = upd.add_mutually_exclusive_group(required=True)
+    source.add_argument('-m', '--message', help='новый текст сообщения')
+    source.add_argument('-f', '--file', help='файл с новым содержимым')
+    upd.add_argument('-d', '--degree', type=int, default=2, choices=Stega.DEGREES)
+    upd.add_argument('-o', '--out', help='куда сохранить результат (по умолчанию картинка меняется на месте)')
+    upd.add_argument('--band-rows', type=int, default=256, help='полосы по столько строк для несжатых картинок')
+    upd.add_argument('--compress', default='none', choices=('auto', 'none', 'zlib', 'lzma', 'zstd'),
+                     help='сжатие сообщения; по умолчанию none, тогда меняются только правленые байты')
+
+    dec = commands.add_parser('decrypt', parents=[common], help='расшифровать сообщение из картинки')
+    dec.add_argument('image')
+    dec.add_argument('-d', '--degree', type=int, default=2, choices=Stega.DEGREES)
+    dec.add_argument('-o', '--out', help='записать сообщение в файл, а не в консоль')
+    dec.add_argument('--legacy', action='store_true', help='старый формат без заголовка')
+
+    shard = commands.add_parser('shard', parents=[common, saving], help='разделить сообщение на несколько картинок')
+    shard.add_argument('covers', nargs='+', help='исходные картинки')
+    source = shard.add_mutually_exclusive_group(required=True)
+    source.add_argument('-m', '--message', help='текст сообщения')
+    source.add_argument('-f', '--file', help='файл, содержимое которого нужно спрятать')
+    shard.add_argument('-d', '--degree', type=int, default=2, choices=Stega.DEGREES)
+    shard.add_argument('--out-dir', required=True, help='каталог для результатов')
+    shard.add_argument('-j', '--workers', type=int, help='число процессов (по умолчанию - число ядер)')
+    shard.add_argument('--compress', default='auto', choices=('auto', 'none', 'zlib', 'lzma', 'zstd'))
+
+    unshard = commands.add_parser('unshard', parents=[common], help='собрать сообщение из нескольких картинок')
+    unshard.add_argument('images', nargs='+', help='все части, в любом порядке')
+    unshard.add_argument('-d', '--degree', type=int, default=2, choices=Stega.DEGREES)
+    unshard.add_argument('-o', '--out', help='записать сообщение в файл, а не в консоль')
+    unshard.add_argument('-j', '--workers', type=int, help='число процессов (по умолчанию - число ядер)')
+
+    bat = commands.add_parser('batch', parents=[common, saving], help='обработать много картинок параллельно')
+    jobs = bat.add_mutually_exclusive_group(required=True)
+    jobs.add_argument('--manifest', help='CSV или JSONL со столбцами cover, payload (или text), output')
+    jobs.add_argument('--dir', help='каталог с картинками')
+    bat.add_argument('--mode', default='encrypt', choices=('encrypt', 'decrypt'))
+    bat.add_argument('--payload', help='файл сообщения для режима --dir')
+    bat.add_argument('--out-dir', help='каталог для результатов в режиме --dir')
+    bat.add_argument('-d', '--degree', type=int, default=2, choices=Stega.DEGREES)
+    bat.add_argument('-j', '--workers', type=int, help='число процессов (по умолчанию - число ядер)')
+    bat.add_argument('--in-flight', type=int, help='сколько задач одновременно держать в очереди')
+    bat.add_argument('--compress', default='auto', choices=('auto', 'none', 'zlib', 'lzma', 'zstd'))
+
+    scan = commands.add_parser('scan', parents=[common], help='найти картинки, в которых, вероятно, спрятано сообщение')
+    scan.add_argument('paths', nargs='+', help='картинки и каталоги (обходятся рекурсивно)')
+    scan.add_argument('--sample', type=int, help='сколько отсчётов начала картинки брать для статистических тестов')
+    scan.add_argument('--top', type=int, default=20, help='сколько самых подозрительных картинок перечислить в конце')
+    scan.add_argument('-j', '--workers', type=int, help='число процессов (по умолчанию - число ядер)')
+    scan.add_argument('--in-flight', type=int, help='сколько задач одновременно держать в очереди')
+
+    args = parser.parse_args(argv)
+    meter = metrics_module.Metrics() if args.stats else None
+    inst = Stega(metrics=meter)
+
+    try: #обычные ошибки (нет сообщения, неверный ключ, неподходящий формат) - сообщение в stderr, а не трассировка
+        if args.command == 'encrypt':
+            msg = open(args.file, 'rb') if args.file else args.message #файл читается по частям
+
+            try:
+                if args.band_rows:
+                    out = inst.encrypt_tiled(msg, args.degree, args.cover, args.out, band_rows=args.band_rows,
+                                             key=args.key, compress=args.compress, channels=args.channels)
+                else:
+                    out = inst.encrypt(msg, args.degree, args.cover, out=args.out, key=args.key, compress=args.compress,
+                                       channels=args.channels, profile=args.profile)
+            finally:
+                if args.file:
+                    msg.close()
+            code = 0 if out else 1
+
+        elif args.command == 'update':
+            msg = open(args.file, 'rb') if args.file else args.message
+
+            try:
+                out = inst.update(msg, args.degree, args.image, out=args.out, key=args.key, compress=args.compress,
+                                  channels=args.channels, profile=args.profile, band_rows=args.band_rows)
+            finally:
+                if args.file:
+                    msg.close()
+            code = 0 if out else 1
+
+        elif args.command == 'shard':
+            os.makedirs(args.out_dir, exist_ok=True)
+            outs = [os.path.join(args.out_dir, os.path.splitext(os.path.basename(cover))[0] + '.png') for cover in args.covers]
+            msg = open(args.file, 'rb') if args.file else args.message
+
+            try:
+                done = inst.encrypt_sharded(msg, args.degree, args.covers, outs, key=args.key,
+                                            compress=args.compress, workers=args.workers, channels=args.channels,
+                                            profile=args.profile)
+            finally:
+                if args.file:
+                    msg.close()
+            code = 0 if done else 1
+
+        elif args.command in ('decrypt', 'unshard'):
+            if args.command == 'decrypt':
+                message = inst.decrypt(args.degree, args.image, legacy=args.legacy, key=args.key, channels=args.channels)
+            else:
+                message = inst.decrypt_sharded(args.degree, args.images, key=args.key, workers=args.workers,
+                                               channels=args.channels)
+
+            if args.out:
+                with open(args.out, 'wb') as f:
+                    f.write(message.encode('utf-8') if isinstance(message, str) else message)
+            elif isinstance(message, str):
+                print(message)
+            else: #двоичное сообщение пишется как есть, а не в виде b'...'
+                sys.stdout.buffer.write(message)
+                sys.stdout.flush()
+            code = 0
 
-            msg += sym 
+        elif args.command == 'scan':
+            import scanner
 
-        return msg
+            ranking = scanner.Ranking(args.top)
+            for result in scanner.scan(args.paths, args.workers, args.in_flight, key=args.key, channels=args.channels,
+                                       sample=args.sample or scanner.SAMPLE, stats=meter is not None):
+                ranking.add(result)
+                if meter is not None and 'metrics' in result:
+                    meter.merge(result.pop('metrics'))
+                print(json.dumps(result, ensure_ascii=False), flush=True)
 
+            print(ranking.summary(), file=sys.stderr)
+            code = 0 if ranking.failed == 0 else 1
 
+        else:
+            import batch
 
+            if args.manifest:
+                tasks = batch.load_manifest(args.manifest, args.mode, args.degree, args.key)
+            else:
+                if not args.out_dir or (args.mode == 'encrypt' and not args.payload):
+                    parser.error('для --dir нужны --out-dir и (в режиме encrypt) --payload')
+                tasks = batch.scan_directory(args.dir, args.out_dir, args.mode, args.degree, args.payload, args.key)
 
+            tasks = (dict(task, compress=args.compress, channels=args.channels, profile=args.profile, stats=meter is not None)
+                     for task in tasks)
 
-def main():
+            stats = batch.Throughput()
+            for result in batch.run_batch(tasks, args.workers, args.in_flight):
+                stats.add(result)
+                if meter is not None and 'metrics' in result:
+                    meter.merge(result['metrics'])
+                print(json.dumps(result, ensure_ascii=False), flush=True)
 
-    # img = Image.open('pics/cat.png').convert('RGB')
-    # img.save('pics/cat_rgb.png')
-    # print(img.mode)
+            print(stats.summary(), file=sys.stderr)
+            code = 0 if stats.failed == 0 else 1
 
-    inst = Stega()
-    inst.encrypt('привет я люблю ООП', 2, 'pics/cat.png')
-    message = inst.decrypt(2, 'pics/encoded.png')
-    print(message) #output: hello I love OOP
+    except (ValueError, OSError, RuntimeError) as e:
+        print(f'ошибка: {e}', file=sys.stderr)
+        code = 1
 
+    if meter is not None:
+        print(meter.prometheus() if args.stats == 'prometheus' else meter.summary(), file=sys.stderr)
 
-    print('завершено')
+    return code
 
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Пакетная обработка: шифрование и расшифровка тысяч картинок в пуле процессов
+"""
+
+import csv
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import metrics
+from app import Stega
+
+
+IMAGE_EXTENSIONS = ('.png', '.bmp', '.tif', '.tiff')
+
+
+def load_manifest(path, mode='encrypt', degree=2, key=None):
+    """
+    Читает задачи из CSV (с заголовком) или JSONL. Поля: cover, payload (путь к файлу сообщения)
+    или text (само сообщение), output; необязательные mode, degree и key переопределяют значения по умолчанию
+    """
+
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+
+        for row in rows:
+            yield {
+                'mode': row.get('mode') or mode,
+                'degree': int(row.get('degree') or degree),
+                'cover': row['cover'],
+                'payload': row.get('payload') or None,
+                'text': row.get('text') or None,
+                'output': row.get('output') or None,
+                'key': row.get('key') or key,
+            }
+
+
+def scan_directory(directory, out_dir, mode='encrypt', degree=2, payload=None, key=None):
+    """Задачи для всех картинок каталога: одно сообщение payload в каждую, результаты - в out_dir"""
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        name, ext = os.path.splitext(entry.name)
+        if not entry.is_file() or ext.lower() not in IMAGE_EXTENSIONS:
+            continue
+
+        suffix = '.png' if mode == 'encrypt' else '.payload'
+        yield {
+            'mode': mode,
+            'degree': degree,
+            'cover': entry.path,
+            'payload': payload,
+            'text': None,
+            'output': os.path.join(out_dir, name + suffix),
+            'key': key,
+        }
+
+
+def _run_job(job):
+    """Выполняет одну задачу в процессе пула. Исключения не выбрасываются, а попадают в результат"""
+
+    result = {'mode': job['mode'], 'cover': job['cover'], 'output': job['output'], 'status': 'ok'}
+    started = time.perf_counter()
+
+    try:
+        result['image_bytes'] = os.path.getsize(job['cover'])
+        meter = metrics.Metrics() if job.get('stats') else None
+        inst = Stega(metrics=meter)
+
+        if job['mode'] == 'encrypt':
+            if job['text'] is not None:
+                msg = job['text']
+            else:
+                with open(job['payload'], 'rb') as f:
+                    msg = f.read()
+
+            result['payload_bytes'] = len(msg.encode('utf-8') if isinstance(msg, str) else msg)
+
+            out = inst.encrypt(msg, job['degree'], job['cover'], out=job['output'], key=job.get('key'),
+                               compress=job.get('compress', 'auto'), channels=job.get('channels'),
+                               profile=job.get('profile', 'balanced'))
+            if out is None: #размер сжатого сообщения заранее неизвестен, поэтому вместимость проверяет сам encrypt
+                raise ValueError('сообщение не помещается в картинку')
+
+        else:
+            msg = inst.decrypt(job['degree'], job['cover'], key=job.get('key'), channels=job.get('channels'))
+            data = msg.encode('utf-8') if isinstance(msg, str) else msg
+            result['payload_bytes'] = len(data)
+
+            if job['output']:
+                with open(job['output'], 'wb') as f:
+                    f.write(data)
+            elif isinstance(msg, str):
+                result['message'] = msg
+
+        if meter is not None:
+            result['metrics'] = meter.snapshot()
+
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    result['seconds'] = round(time.perf_counter() - started, 6)
+    return result
+
+
+def run_batch(jobs, workers=None, in_flight=None, func=_run_job):
+    """
+    Раздаёт задачи пулу процессов и возвращает результаты по мере готовности (генератор).
+    Одновременно в работе не больше in_flight задач, так что манифест читается потоково.
+    func - функция уровня модуля, выполняющая одну задачу (по умолчанию шифрование или расшифровка)
+    """
+
+    workers = workers or os.cpu_count() or 1
+    in_flight = in_flight or workers * 2
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+
+        for job in jobs:
+            pending.add(pool.submit(func, job))
+
+            if len(pending) >= in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+class Throughput():
+    """
+    Считает пропускную способность пакета: картинок в секунду и мегабайт картинок в секунду
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.done = 0
+        self.failed = 0
+        self.image_bytes = 0
+        self.payload_bytes = 0
+
+    def add(self, result):
+        self.done += 1
+        if result['status'] != 'ok':
+            self.failed += 1
+            return
+
+        self.image_bytes += result.get('image_bytes', 0)
+        self.payload_bytes += result.get('payload_bytes', 0)
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (f'готово {self.done} (ошибок {self.failed}) за {elapsed:.2f} с: '
+                f'{self.done / elapsed:.1f} картинок/с, {self.image_bytes / elapsed / 2**20:.2f} МБ/с, '
+                f'сообщения {self.payload_bytes / elapsed / 2**20:.2f} МБ/с')
@@ -0,0 +1,251 @@
+"""
+Замеры производительности Stega на синтетических картинках
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError: #Windows
+    resource = None
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from app import Stega
+
+
+def make_cover(width, height, mode='RGB', seed=0):
+    """Синтетическая картинка: градиент с шумом, чтобы PNG сжимался примерно как фотография"""
+
+    rng = np.random.default_rng(seed)
+    gradient = (np.arange(width, dtype=np.uint16)[None, :] + np.arange(height, dtype=np.uint16)[:, None]) % 256
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    for channel in range(3):
+        pixels[..., channel] = (gradient + rng.integers(0, 16, (height, width), dtype=np.uint16)) % 256
+
+    return Image.fromarray(pixels).convert(mode)
+
+
+def best_time(func, repeat):
+    """Лучшее время из repeat запусков, в секундах"""
+
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+
+    return best
+
+
+def bench_decrypt_size(sizes, message, degree=2, repeat=5):
+    """
+    Время decrypt для одного и того же сообщения в квадратных PNG разного размера
+    в сравнении с полным декодированием картинки
+    """
+
+    inst = Stega()
+    rows = []
+
+    for side in sizes:
+        data = inst.encrypt_bytes(message, degree, make_cover(side, side), compress_level=1)
+
+        assert inst.decrypt(degree, data) == message
+        decrypt = best_time(lambda: inst.decrypt(degree, data), repeat)
+        full = best_time(lambda: Image.open(io.BytesIO(data)).load(), repeat)
+
+        rows.append({'side': side, 'megapixels': side * side / 1e6, 'file_mb': len(data) / 2**20,
+                     'decrypt_ms': decrypt * 1000, 'full_decode_ms': full * 1000})
+
+    return rows
+
+
+class PhaseTimer():
+    """
+    Функция progress для Stega: запоминает время каждого этапа (от его начала до начала следующего)
+    """
+
+    def __init__(self):
+        self.marks = [('подготовка', time.perf_counter())]
+
+    def __call__(self, stage, done=None, total=None):
+        if stage != self.marks[-1][0]:
+            self.marks.append((stage, time.perf_counter()))
+
+    def phases(self):
+        self.marks.append(('конец', time.perf_counter()))
+        result = {}
+        for (stage, started), (_, finished) in zip(self.marks, self.marks[1:]):
+            result[stage] = result.get(stage, 0.0) + finished - started
+        return result
+
+
+def peak_rss_mb():
+    """Пиковый объём памяти процесса в МБ (None, если узнать нельзя)"""
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10 #на macOS - байты, на Linux - килобайты
+
+
+def run_case(case):
+    """
+    Один замер: шифрование и расшифровка сообщения размером case['payload'] байт в синтетическую картинку.
+    Запускается в отдельном процессе, чтобы пиковая память относилась только к этому замеру
+    """
+
+    width, height = case['size']
+    cover = io.BytesIO()
+    make_cover(width, height, case['mode']).save(cover, format='PNG')
+    cover = cover.getvalue()
+
+    inst = Stega()
+    result = dict(case, cover_bytes=len(cover))
+
+    if inst.capacity(cover, case['degree']) < case['payload'] * 8:
+        result['skipped'] = 'не помещается'
+        return result
+
+    message = np.random.default_rng(1).integers(0, 256, case['payload'], dtype=np.uint8).tobytes()
+    encrypt, decrypt = [], []
+
+    for _ in range(case['repeat']):
+        timer = PhaseTimer()
+        encoded = Stega(progress=timer).encrypt_bytes(message, case['degree'], cover)
+        encrypt.append(timer.phases())
+
+        timer = PhaseTimer()
+        assert Stega(progress=timer).decrypt(case['degree'], encoded) == message
+        decrypt.append(timer.phases())
+
+    best = lambda runs: min(runs, key=lambda phases: sum(phases.values()))
+    result['encrypt'] = best(encrypt)
+    result['decrypt'] = best(decrypt)
+    result['encrypt_seconds'] = sum(result['encrypt'].values())
+    result['decrypt_seconds'] = sum(result['decrypt'].values())
+    result['encrypt_payload_bytes_per_s'] = case['payload'] / result['encrypt_seconds']
+    result['encrypt_pixel_bytes_per_s'] = width * height * Image.getmodebands(case['mode']) / result['encrypt_seconds']
+    result['decrypt_payload_bytes_per_s'] = case['payload'] / result['decrypt_seconds']
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def bench_suite(sizes, modes, degrees, payloads, repeat=3):
+    """Все сочетания размера картинки, режима, degree и размера сообщения; каждое - в новом процессе"""
+
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+        for size in sizes:
+            for mode in modes:
+                for degree in degrees:
+                    for payload in payloads:
+                        case = {'size': size, 'mode': mode, 'degree': degree, 'payload': payload, 'repeat': repeat}
+                        yield pool.submit(run_case, case).result()
+
+
+def environment():
+    """Описание ревизии и окружения для файла с результатами"""
+
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() #ревизия кода, а не текущего каталога
+    except OSError:
+        revision = None
+
+    return {
+        'revision': revision or None,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+    }
+
+
+def _case_key(result):
+    return (tuple(result['size']), result['mode'], result['degree'], result['payload'])
+
+
+def compare(old_path, new_path):
+    """Печатает, во сколько раз изменилось время шифрования и расшифровки между двумя прогонами"""
+
+    with open(old_path, encoding='utf-8') as f:
+        old = {_case_key(r): r for r in json.load(f)['results'] if 'skipped' not in r}
+    with open(new_path, encoding='utf-8') as f:
+        new = [r for r in json.load(f)['results'] if 'skipped' not in r]
+
+    print(f'{"размер":>11} {"режим":>5} {"deg":>3} {"сообщение":>10} {"encrypt":>9} {"decrypt":>9}')
+    for result in new:
+        before = old.get(_case_key(result))
+        if before is None:
+            continue
+        enc = result['encrypt_seconds'] / before['encrypt_seconds']
+        dec = result['decrypt_seconds'] / before['decrypt_seconds']
+        print(f'{"x".join(map(str, result["size"])):>11} {result["mode"]:>5} {result["degree"]:>3} '
+              f'{result["payload"]:>10} {enc:>8.2f}x {dec:>8.2f}x')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench.py', description='замеры производительности SpyCats')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    dec = commands.add_parser('decrypt-size', help='время decrypt в зависимости от размера картинки')
+    dec.add_argument('--sizes', type=int, nargs='+', default=[256, 512, 1024, 2048, 4096])
+    dec.add_argument('--message', default='привет я люблю ООП')
+    dec.add_argument('-d', '--degree', type=int, default=2, choices=Stega.DEGREES)
+    dec.add_argument('-r', '--repeat', type=int, default=5)
+
+    suite = commands.add_parser('suite', help='полный набор замеров с сохранением в JSON')
+    suite.add_argument('--sizes', nargs='+', default=['512x512', '1024x1024', '2048x2048'])
+    suite.add_argument('--modes', nargs='+', default=['RGB', 'RGBA', 'L', 'P'])
+    suite.add_argument('--degrees', type=int, nargs='+', default=list(Stega.DEGREES), choices=Stega.DEGREES)
+    suite.add_argument('--payloads', type=int, nargs='+', default=[100, 10_000, 1_000_000])
+    suite.add_argument('-r', '--repeat', type=int, default=3)
+    suite.add_argument('-o', '--out', default='bench_results.json')
+
+    cmp = commands.add_parser('compare', help='сравнить два файла результатов suite')
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'suite':
+        sizes = [tuple(int(v) for v in size.split('x')) for size in args.sizes]
+        results = []
+        for result in bench_suite(sizes, args.modes, args.degrees, args.payloads, args.repeat):
+            results.append(result)
+            if 'skipped' in result:
+                continue
+            print(f'{"x".join(map(str, result["size"])):>11} {result["mode"]:>5} d={result["degree"]} '
+                  f'{result["payload"]:>8} Б: encrypt {result["encrypt_seconds"] * 1000:8.1f} мс, '
+                  f'decrypt {result["decrypt_seconds"] * 1000:7.1f} мс, '
+                  f'{result["encrypt_payload_bytes_per_s"] / 2**20:7.2f} МБ/с, RSS {result["peak_rss_mb"] or 0:.0f} МБ', flush=True)
+
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'results': results}, f, ensure_ascii=False, indent=1)
+        print(f'результаты сохранены в {args.out}')
+
+    elif args.command == 'compare':
+        compare(args.old, args.new)
+
+    elif args.command == 'decrypt-size':
+        print(f'{"сторона":>8} {"Мпикс":>8} {"файл, МБ":>9} {"decrypt, мс":>12} {"полное декодирование, мс":>25}')
+        for row in bench_decrypt_size(args.sizes, args.message, args.degree, args.repeat):
+            print(f'{row["side"]:>8} {row["megapixels"]:>8.2f} {row["file_mb"]:>9.2f} '
+                  f'{row["decrypt_ms"]:>12.2f} {row["full_decode_ms"]:>25.2f}')
+
+
+if __name__ == '__main__':
+    main()
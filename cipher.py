@@ -0,0 +1,139 @@
+"""
+Шифрование сообщения ключом: AES-256-GCM по частям (схема STREAM), так что большое сообщение
+не нужно держать в памяти дважды, а подмена или перестановка частей обнаруживается.
+Ключ выводится из пароля через PBKDF2; результат кэшируется. Нужен пакет cryptography
+"""
+
+import functools
+import hashlib
+import hmac
+import os
+import struct
+
+import numpy as np
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError: #без cryptography шифрование с ключом недоступно
+    AESGCM = None
+
+
+# Заголовок шифрования: соль PBKDF2, случайное число сообщения, число итераций PBKDF2,
+# размер части открытого текста, проверочное значение ключа
+HEADER = struct.Struct('>16s16sII16s')
+CHUNK = 64 * 2**10
+TAG = 16 #метка GCM после каждой части
+ITERATIONS = 200_000
+MAX_ITERATIONS = 1_000_000 #больше из заголовка не принимается, чтобы чужая картинка не занимала процессор надолго
+
+_salts = {} #хэш пароля: соль, которой шифруются сообщения в этом процессе, чтобы PBKDF2 не считался заново
+
+
+def _require():
+    if AESGCM is None:
+        raise RuntimeError('для шифрования с ключом нужен пакет cryptography (pip install cryptography)')
+
+
+@functools.lru_cache(maxsize=16)
+def _master(passphrase, salt, iterations):
+    """Главный ключ из пароля. Кэшируется: PBKDF2 нарочно медленный"""
+    return hashlib.pbkdf2_hmac('sha256', passphrase, salt, iterations)
+
+
+def _keys(passphrase, salt, nonce, iterations):
+    """(ключ AES сообщения, проверочное значение) - у каждого сообщения свой ключ, производный от nonce"""
+
+    if isinstance(passphrase, str):
+        passphrase = passphrase.encode('utf-8')
+
+    master = _master(bytes(passphrase), salt, iterations)
+    key = hmac.new(master, b'key' + nonce, hashlib.sha256).digest()
+    check = hmac.new(master, b'check' + nonce, hashlib.sha256).digest()[:16]
+    return key, check
+
+
+def _nonce(counter, last):
+    """Nonce части: её номер и признак последней части (STREAM)"""
+    return counter.to_bytes(11, 'big') + bytes([last])
+
+
+def sealed_size(length, chunk=CHUNK):
+    """Размер зашифрованного сообщения длиной length вместе с заголовком и метками"""
+    return HEADER.size + length + TAG * max(1, -(-length // chunk))
+
+
+def seal(passphrase, read, length, out, chunk=CHUNK):
+    """
+    Шифрует length байтов, которые читаются частями через read(n), и записывает результат
+    в out (массив numpy длиной sealed_size(length)). Открытый текст в памяти - не больше одной части
+    """
+
+    _require()
+
+    digest = hashlib.sha256(passphrase.encode('utf-8') if isinstance(passphrase, str) else bytes(passphrase)).digest()
+    salt = _salts.setdefault(digest, os.urandom(16))
+    nonce = os.urandom(16)
+    key, check = _keys(passphrase, salt, nonce, ITERATIONS)
+    aes = AESGCM(key)
+
+    out[:HEADER.size] = np.frombuffer(HEADER.pack(salt, nonce, ITERATIONS, chunk, check), dtype=np.uint8)
+    pos = HEADER.size
+    count = max(1, -(-length // chunk))
+
+    for counter in range(count):
+        size = min(chunk, length - counter * chunk)
+        part = read(size)
+        if len(part) != size:
+            raise ValueError('сообщение оказалось короче заявленной длины')
+
+        sealed = aes.encrypt(_nonce(counter, counter == count - 1), part, None)
+        out[pos:pos + len(sealed)] = np.frombuffer(sealed, dtype=np.uint8)
+        pos += len(sealed)
+
+
+def read_header(passphrase, head):
+    """
+    Проверяет ключ по заголовку шифрования head - до того, как читать само сообщение.
+    Возвращает (ключ AES, размер части) для unseal
+    """
+
+    _require()
+
+    salt, nonce, iterations, chunk, check = HEADER.unpack(bytes(head))
+    if chunk == 0:
+        raise ValueError('повреждённый заголовок шифрования')
+    if not 0 < iterations <= MAX_ITERATIONS: #проверяется до того, как выводить ключ
+        raise ValueError(f'повреждённый заголовок шифрования: {iterations} итераций PBKDF2, допустимо до {MAX_ITERATIONS}')
+
+    key, expected = _keys(passphrase, salt, nonce, iterations)
+    if not hmac.compare_digest(check, expected):
+        raise ValueError('неверный ключ')
+
+    return key, chunk
+
+
+def unseal(params, body):
+    """Расшифровывает части body (массив numpy после заголовка) в один массив открытого текста"""
+
+    key, chunk = params
+    aes = AESGCM(key)
+
+    count = max(1, -(-len(body) // (chunk + TAG)))
+    length = len(body) - TAG * count
+    if length < 0 or -(-length // chunk) > count:
+        raise ValueError('сообщение повреждено: неверная длина зашифрованных данных')
+
+    out = np.empty(length, dtype=np.uint8)
+    view = memoryview(body)
+
+    for counter in range(count):
+        start = counter * (chunk + TAG)
+        part = view[start:start + chunk + TAG]
+        try:
+            plain = aes.decrypt(_nonce(counter, counter == count - 1), part, None)
+        except InvalidTag:
+            raise ValueError('сообщение повреждено или ключ неверный') from None
+        out[counter * chunk:counter * chunk + len(plain)] = np.frombuffer(plain, dtype=np.uint8)
+
+    return out
@@ -0,0 +1,154 @@
+"""
+Сжатие сообщения перед встраиванием: меньше байтов - меньше затронутых пикселей и меньше работы
+при встраивании и извлечении. Кодек выбирается пробным сжатием начала сообщения
+"""
+
+import lzma
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError: #без zstandard выбор идёт только между zlib и lzma
+    zstandard = None
+
+
+# Номер кодека хранится в флагах заголовка Stega
+NONE, ZLIB, LZMA, ZSTD = 0, 1, 2, 3
+NAMES = {'none': NONE, 'zlib': ZLIB, 'lzma': LZMA, 'zstd': ZSTD}
+
+SAMPLE = 64 * 2**10 #сколько байтов начала сообщения пробно сжимается для выбора кодека
+MIN_SIZE = 64 #более короткие сообщения не сжимаются: выигрыша почти не бывает
+CHUNK = 2**20 #остаток сообщения подаётся кодеку частями такого размера
+GAIN = 0.9 #более медленный кодек выбирается, только если сжимает хотя бы на 10% лучше
+
+_LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 6}]
+
+# Перед сжатыми данными - длина исходного сообщения: распаковка не выходит за неё,
+# так что маленькая картинка не может развернуться в гигабайты ("zip-бомба")
+LENGTH = struct.Struct('>Q')
+DEFLATE_RATIO = 1032 #больше, чем во столько раз, deflate не сжимает: бо́льшая заявленная длина - подделка
+
+
+def available():
+    """Кодеки, которые можно использовать, от самого быстрого к самому медленному"""
+    return ([ZSTD] if zstandard is not None else []) + [ZLIB, LZMA]
+
+
+def _compressor(codec):
+    if codec == ZLIB:
+        return zlib.compressobj(6, zlib.DEFLATED, -15) #без заголовка zlib: целостность проверяет crc32 Stega
+    if codec == LZMA:
+        return lzma.LZMACompressor(lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError('для сжатия zstd нужен пакет zstandard (pip install zstandard)')
+        return zstandard.ZstdCompressor(level=3).compressobj()
+
+    raise ValueError(f'неизвестный кодек сжатия: {codec}')
+
+
+def _pack(codec, data):
+    comp = _compressor(codec)
+    return comp.compress(data) + comp.flush()
+
+
+def choose(sample):
+    """Кодек, лучше всего сжимающий sample, или NONE, если сжатие его не уменьшает.
+    Если не помог даже самый быстрый кодек (случайные или уже сжатые данные), остальные не пробуются"""
+
+    best, best_size = NONE, len(sample)
+    for codec in available():
+        size = len(_pack(codec, sample))
+        if size < best_size * (1 if best == NONE else GAIN):
+            best, best_size = codec, size
+        elif best == NONE:
+            break
+
+    return best
+
+
+def compress(read, length, codec='auto'):
+    """
+    Сжимает length байтов, которые читаются частями через read(n).
+    codec - 'auto' (выбор по пробному сжатию) или имя из NAMES.
+    Возвращает (кодек, LENGTH и сжатые bytes) или (NONE, None), если сжатие не уменьшает сообщение
+    """
+
+    if codec == 'auto' and length < MIN_SIZE:
+        return NONE, None
+
+    sample = read(min(SAMPLE, length))
+    codec = choose(sample) if codec == 'auto' else NAMES[codec]
+    if codec == NONE:
+        return NONE, None
+
+    comp = _compressor(codec)
+    parts = [LENGTH.pack(length), comp.compress(sample)]
+    left = length - len(sample)
+    while left > 0:
+        part = read(min(CHUNK, left))
+        if not part:
+            raise ValueError('сообщение оказалось короче заявленной длины')
+        parts.append(comp.compress(part))
+        left -= len(part)
+    parts.append(comp.flush())
+
+    packed = b''.join(parts)
+    if len(packed) >= length:
+        return NONE, None
+
+    return codec, packed
+
+
+def decompress(codec, data):
+    """Обратное преобразование для compress. Распаковывается не больше записанной длины;
+    если данные разворачиваются в другое число байтов, сообщение считается повреждённым"""
+
+    if codec == NONE:
+        return data
+    if codec not in (ZLIB, LZMA, ZSTD):
+        raise ValueError(f'неизвестный кодек сжатия: {codec}')
+    if len(data) < LENGTH.size:
+        raise ValueError('сообщение повреждено: нет длины сжатых данных')
+
+    length = LENGTH.unpack(bytes(data[:LENGTH.size]))[0]
+    data = data[LENGTH.size:]
+    if codec == ZLIB and length > len(data) * DEFLATE_RATIO:
+        raise ValueError('сообщение повреждено: заявленная длина невозможна для сжатых данных такого размера')
+
+    if codec == ZSTD and zstandard is None:
+        raise RuntimeError('сообщение сжато zstd: нужен пакет zstandard (pip install zstandard)')
+
+    try:
+        if codec == ZLIB:
+            dec = zlib.decompressobj(-15)
+            out = dec.decompress(data, max(length, 1)) #max_length=0 у zlib означает "без ограничения"
+            done = dec.eof and not dec.unconsumed_tail
+        elif codec == LZMA:
+            dec = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+            out = dec.decompress(data, max_length=length)
+            done = dec.eof
+        else:
+            out, done = _unzstd(data, length)
+    except (zlib.error, lzma.LZMAError) + ((zstandard.ZstdError,) if zstandard is not None else ()) as e:
+        raise ValueError(f'сообщение повреждено: не удалось распаковать ({e})') from None
+
+    if len(out) != length or not done:
+        raise ValueError('сообщение повреждено: распакованная длина не совпадает с записанной')
+    return out
+
+
+def _unzstd(data, length):
+    """Распаковка zstd не больше чем в length байтов. Возвращает (байты, дошли ли до конца потока)"""
+
+    reader = zstandard.ZstdDecompressor().stream_reader(bytes(data), read_across_frames=False)
+    parts, size = [], 0
+    while size <= length: #читаем на байт больше, чтобы заметить лишние данные
+        part = reader.read(length + 1 - size)
+        if not part:
+            return b''.join(parts), True
+        parts.append(part)
+        size += len(part)
+
+    return b''.join(parts), False
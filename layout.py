@@ -0,0 +1,85 @@
+"""
+Какие каналы пикселя и сколько младших битов каждого из них занимает сообщение.
+Сообщение пишется порциями по degree бит в ячейки: ячейка - degree бит одного канала одного пикселя.
+Ячейки пикселя идут по выбранным каналам, внутри канала - от старших из отведённых ему битов к младшим
+"""
+
+import numpy as np
+from PIL import ImageMode
+
+
+NATIVE = ('L', 'LA', 'RGB', 'RGBA', 'I;16', 'I') #режимы, пиксели которых обрабатываются без преобразования
+WIDE = ('I;16', 'I') #16-битные отсчёты
+
+
+def native_mode(mode, info=None):
+    """Режим, в котором картинка обрабатывается: свой, если он поддерживается, иначе ближайший из NATIVE"""
+
+    if mode in NATIVE:
+        return mode
+    if mode.startswith('I;16'):
+        return 'I'
+    if mode == '1':
+        return 'L'
+    if mode == 'La':
+        return 'LA'
+    if {'A', 'a'} & set(ImageMode.getmode(mode).bands) or (info and 'transparency' in info):
+        return 'RGBA'
+    return 'RGB'
+
+
+class Layout():
+    """
+    Раскладка сообщения по каналам картинки в режиме mode.
+    channels - None (все каналы, кроме альфы), число (первые n каналов), строка с именами каналов ('RGBA', 'A')
+    или словарь {канал: бит}, где число бит кратно degree (например {'R': 2, 'G': 2, 'B': 2, 'A': 1} при degree=1)
+    """
+
+    def __init__(self, mode, degree, channels=None):
+        bands = ImageMode.getmode(mode).bands
+        depth = 16 if mode in WIDE else 8
+
+        if channels is None:
+            channels = [band for band in bands if band != 'A'] or list(bands)
+        elif isinstance(channels, int):
+            channels = list(bands[:channels])
+
+        bits = channels if isinstance(channels, dict) else {band: degree for band in channels}
+
+        self.band, self.shift = [], [] #для каждой ячейки пикселя: номер канала и сдвиг её битов
+        for band in bands:
+            count = bits.get(band, 0)
+            if count % degree or not 0 <= count <= depth:
+                raise ValueError(f'число бит канала {band} должно быть кратно degree={degree} и не больше {depth}')
+            for shift in range(count - degree, -1, -degree):
+                self.band.append(bands.index(band))
+                self.shift.append(shift)
+
+        unknown = set(bits) - set(bands)
+        if unknown:
+            raise ValueError(f'в режиме {mode} нет каналов {sorted(unknown)}')
+        if not self.band:
+            raise ValueError('не выбрано ни одного канала')
+
+        self.mode = mode
+        self.nbands = len(bands)
+        self.slots = len(self.band) #ячеек на пиксель
+
+        #ячейка k - это просто k-й отсчёт картинки: сообщение занимает все каналы по degree бит
+        self.identity = self.band == list(range(self.nbands)) and not any(self.shift)
+
+        self.band = np.array(self.band, dtype=np.int64)
+        self.shift = np.array(self.shift, dtype=np.uint8)
+
+
+    def carriers(self, size):
+        """Сколько ячеек в картинке размера size"""
+        return size[0] * size[1] * self.slots
+
+
+    def locate(self, slots):
+        """Для номеров ячеек slots возвращает (номера отсчётов в плоском массиве пикселей, сдвиги битов или None)"""
+
+        pixel, slot = np.divmod(slots, self.slots)
+        positions = pixel * self.nbands + self.band[slot]
+        return positions, (self.shift[slot] if self.shift.any() else None)
@@ -0,0 +1,131 @@
+"""
+Замеры внутри Stega: время этапов (span) и счётчики. По умолчанию Stega использует NULL,
+который ничего не делает, так что без включённых метрик накладных расходов почти нет
+"""
+
+import contextlib
+import logging
+import threading
+import time
+
+
+class Metrics():
+    """
+    Собирает время этапов и счётчики; каждое событие передаётся подключённым приёмникам (sinks).
+    Приёмник - функция sink(kind, name, value), где kind - 'span' (value в секундах) или 'count'
+    """
+
+    enabled = True
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self.spans = {} #имя: [сколько раз, суммарное время в секундах]
+        self.counters = {}
+        self.__lock = threading.Lock()
+
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """Замеряет время блока with"""
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+
+    def observe(self, name, seconds):
+        with self.__lock:
+            entry = self.spans.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+        for sink in self.sinks:
+            sink('span', name, seconds)
+
+
+    def count(self, name, value=1):
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+        for sink in self.sinks:
+            sink('count', name, value)
+
+
+    def snapshot(self):
+        """Текущие значения как словарь, который можно передать между процессами и сохранить в JSON"""
+
+        with self.__lock:
+            return {'spans': {name: list(entry) for name, entry in self.spans.items()},
+                    'counters': dict(self.counters)}
+
+
+    def merge(self, snapshot):
+        """Добавляет значения из snapshot() другого экземпляра (например, из процесса пакетной обработки)"""
+
+        with self.__lock:
+            for name, (calls, seconds) in snapshot['spans'].items():
+                entry = self.spans.setdefault(name, [0, 0.0])
+                entry[0] += calls
+                entry[1] += seconds
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def summary(self):
+        """Человекочитаемая сводка: по строке на этап и счётчик"""
+
+        snap = self.snapshot()
+        lines = [f'{name}: {seconds * 1000:.1f} мс ({calls} раз)' for name, (calls, seconds) in snap['spans'].items()]
+        lines += [f'{name}: {value}' for name, value in snap['counters'].items()]
+        return '\n'.join(lines)
+
+
+    def prometheus(self, prefix='spycats'):
+        """Сводка в текстовом формате Prometheus"""
+
+        snap = self.snapshot()
+        lines = [f'# TYPE {prefix}_phase_seconds summary']
+        for name, (calls, seconds) in snap['spans'].items():
+            lines.append(f'{prefix}_phase_seconds_sum{{phase="{name}"}} {seconds:.9f}')
+            lines.append(f'{prefix}_phase_seconds_count{{phase="{name}"}} {calls}')
+
+        for name, value in snap['counters'].items():
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.append(f'{prefix}_{name}_total {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+class _NullMetrics():
+    """Выключенные метрики: те же методы, но без работы"""
+
+    enabled = False
+    __span = contextlib.nullcontext()
+
+    def span(self, name):
+        return self.__span
+
+    def observe(self, name, seconds):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+
+NULL = _NullMetrics()
+
+
+def log_sink(logger=None, level=logging.DEBUG):
+    """Приёмник, который пишет каждое событие в logging"""
+
+    logger = logger or logging.getLogger('spycats')
+
+    def sink(kind, name, value):
+        if kind == 'span':
+            logger.log(level, '%s: %.3f мс', name, value * 1000)
+        else:
+            logger.log(level, '%s += %s', name, value)
+
+    return sink
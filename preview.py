@@ -0,0 +1,131 @@
+"""
+Уменьшенные копии картинок для окна: строятся в фоне и хранятся в LRU-кэше с ограничением по памяти
+"""
+
+import os
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+
+def make_thumbnail(source, size):
+    """
+    Возвращает уменьшенную копию source (путь или PIL.Image), вписанную в size.
+    Для файлов используется draft() (JPEG декодируется сразу в уменьшенном масштабе)
+    и reduce() перед сглаживанием, так что полное разрешение почти не обрабатывается
+    """
+
+    if isinstance(source, Image.Image):
+        img = source.copy()
+    else:
+        img = Image.open(source)
+        img.draft('RGB', size)
+
+    img.thumbnail(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    if img.mode not in ('RGB', 'RGBA', 'L'):
+        img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+
+    return img
+
+
+def _nbytes(img):
+    return img.size[0] * img.size[1] * len(img.getbands())
+
+
+class PreviewCache():
+    """
+    LRU-кэш миниатюр. Ключ - (путь, mtime, размер) для файлов или (имя, размер) для картинок в памяти.
+    Миниатюры строятся в фоновых потоках; готовые попадают в очередь events, которую окно забирает через poll()
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, workers=2):
+        self.max_bytes = max_bytes
+        self.events = queue.Queue()
+        self.__items = OrderedDict()
+        self.__used = 0
+        self.__pending = set()
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+
+
+    def key(self, source, size, name=None):
+        """Ключ кэша. Для картинки в памяти нужно имя, по которому её различать"""
+
+        if isinstance(source, Image.Image):
+            return (name, tuple(size))
+
+        return (os.path.abspath(source), os.stat(source).st_mtime_ns, tuple(size))
+
+
+    def get(self, key):
+        """Миниатюра из кэша или None; найденная становится самой свежей"""
+
+        with self.__lock:
+            img = self.__items.get(key)
+            if img is not None:
+                self.__items.move_to_end(key)
+            return img
+
+
+    def put(self, key, img):
+        with self.__lock:
+            if key in self.__items:
+                self.__used -= _nbytes(self.__items.pop(key))
+
+            self.__items[key] = img
+            self.__used += _nbytes(img)
+
+            while self.__used > self.max_bytes and len(self.__items) > 1: #вытесняем самые старые
+                _, old = self.__items.popitem(last=False)
+                self.__used -= _nbytes(old)
+
+
+    def request(self, source, size, name=None):
+        """
+        Возвращает (ключ, миниатюра), если она уже в кэше. Иначе ставит её построение в очередь
+        и возвращает (ключ, None): готовая миниатюра придёт через poll()
+        """
+
+        key = self.key(source, size, name)
+        img = self.get(key)
+        if img is not None:
+            return key, img
+
+        with self.__lock:
+            if key in self.__pending:
+                return key, None
+            self.__pending.add(key)
+
+        self.__executor.submit(self.__build, key, source, size)
+        return key, None
+
+
+    def __build(self, key, source, size):
+        try:
+            img = make_thumbnail(source, size)
+        except Exception as e:
+            self.events.put((key, None, e))
+        else:
+            self.put(key, img)
+            self.events.put((key, img, None))
+        finally:
+            with self.__lock:
+                self.__pending.discard(key)
+
+
+    def poll(self):
+        """Готовые миниатюры: список (ключ, миниатюра или None, ошибка). Вызывать из потока окна"""
+
+        ready = []
+        while True:
+            try:
+                ready.append(self.events.get_nowait())
+            except queue.Empty:
+                return ready
+
+
+    def shutdown(self):
+        self.__executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,171 @@
+"""
+Построчный доступ к пикселям несжатых картинок (BMP, TIFF без сжатия, PPM) прямо в файле,
+без декодирования всего изображения
+"""
+
+import numpy as np
+from PIL import Image
+
+
+# rawmode из PIL: (режим картинки, байт на пиксель в файле, где в пикселе файла лежат каналы режима)
+RAWMODES = {
+    'RGB': ('RGB', 3, (0, 1, 2)),
+    'BGR': ('RGB', 3, (2, 1, 0)),
+    'RGBX': ('RGB', 4, (0, 1, 2)),
+    'BGRX': ('RGB', 4, (2, 1, 0)),
+    'L': ('L', 1, (0,)),
+    'RGBA': ('RGBA', 4, (0, 1, 2, 3)),
+    'BGRA': ('RGBA', 4, (2, 1, 0, 3)),
+}
+
+
+class RawRaster():
+    """
+    Читает и записывает полосы строк картинки, пиксели которой хранятся в файле без сжатия.
+    Строки нумеруются сверху вниз, каналы в массиве - в порядке режима картинки (L, R, G, B, A)
+    """
+
+    def __init__(self, path, writable=False):
+        with Image.open(path) as img:
+            self.size = img.size
+            self.mode = img.mode
+            self.format = img.format
+            tiles = list(img.tile)
+
+        width = self.size[0]
+        self.strips = [] #(y0, y1, смещение в файле, длина строки в байтах, ориентация, rawmode)
+
+        for tile in tiles:
+            codec, (x0, y0, x1, y1), offset, args = tile[0], tile[1], tile[2], tile[3]
+            if isinstance(args, str):
+                args = (args, 0, 1)
+            rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+
+            if codec != 'raw' or x0 != 0 or x1 != width or RAWMODES.get(rawmode, (None,))[0] != self.mode:
+                raise ValueError(f'{self.format} ({codec}, {rawmode}): построчный доступ возможен только к несжатым BMP, TIFF и PPM')
+
+            stride = stride or width * RAWMODES[rawmode][1]
+            self.strips.append((y0, y1, offset, stride, orientation, rawmode))
+
+        self.strips.sort()
+        self.file = open(path, 'r+b' if writable else 'rb')
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+
+    def __regions(self, y0, y1):
+        """Для строк [y0, y1) возвращает куски по полосам файла: (строки в полосе, смещение, полоса)"""
+
+        for strip in self.strips:
+            sy0, sy1, offset, stride, orientation = strip[:5]
+            a, b = max(y0, sy0), min(y1, sy1)
+            if a >= b:
+                continue
+
+            if orientation < 0: #строки записаны снизу вверх (BMP)
+                first = (sy1 - b)
+            else:
+                first = (a - sy0)
+
+            yield a, b, offset + first * stride, strip
+
+
+    def __view(self, raw, a, b, strip):
+        """Представляет байты полосы файла как массив (строки, ширина, каналы режима) сверху вниз"""
+
+        stride, orientation, rawmode = strip[3:]
+        _, bpp, order = RAWMODES[rawmode]
+
+        rows = raw.reshape(b - a, stride)[:, :self.size[0] * bpp].reshape(b - a, self.size[0], bpp)
+        if orientation < 0:
+            rows = rows[::-1]
+
+        return rows, list(order)
+
+
+    def read_rows(self, y0, y1):
+        """Возвращает строки [y0, y1) как массив uint8 формы (строки, ширина, каналы)"""
+
+        band = np.empty((y1 - y0, self.size[0], Image.getmodebands(self.mode)), dtype=np.uint8)
+
+        for a, b, offset, strip in self.__regions(y0, y1):
+            self.file.seek(offset)
+            raw = np.frombuffer(self.file.read((b - a) * strip[3]), dtype=np.uint8)
+            rows, order = self.__view(raw, a, b, strip)
+            band[a - y0:b - y0] = rows[..., order]
+
+        return band
+
+
+    def write_rows(self, y0, band):
+        """Записывает строки band обратно в файл, начиная со строки y0. Байты выравнивания не меняются"""
+
+        y1 = y0 + len(band)
+
+        for a, b, offset, strip in self.__regions(y0, y1):
+            self.file.seek(offset)
+            raw = np.frombuffer(bytearray(self.file.read((b - a) * strip[3])), dtype=np.uint8)
+            rows, order = self.__view(raw, a, b, strip)
+            rows[..., order] = band[a - y0:b - y0]
+
+            self.file.seek(offset)
+            self.file.write(raw.tobytes())
+
+
+def _replace_tile(tile, extents, offset):
+    """Копия тайла PIL с другими границами и смещением"""
+    if hasattr(tile, '_replace'):
+        return tile._replace(extents=extents, offset=offset)
+    return (tile[0], extents, offset, tile[3])
+
+
+def decode_rows(img, rows):
+    """
+    Декодирует только первые rows строк только что открытой (ещё не загруженной) картинки
+    и возвращает её же высотой rows. Работает для PNG без чересстрочности и несжатых BMP, TIFF, PPM:
+    распаковка останавливается, как только нужные строки прочитаны. Для остальных форматов (и если
+    другая версия PIL не позволит так остановить распаковку) картинка декодируется целиком и обрезается
+    """
+
+    width, height = img.size
+    rows = min(rows, height)
+    tiles = list(getattr(img, 'tile', None) or [])
+
+    if rows == height or not tiles or img.info.get('interlace'):
+        return img.crop((0, 0, width, rows)) if rows < height else img
+
+    new_tiles = []
+    for tile in tiles:
+        codec, (x0, y0, x1, y1), offset, args = tile[0], tile[1], tile[2], tile[3]
+        if y0 >= rows:
+            continue #полоса целиком ниже нужных строк
+
+        if codec == 'raw' and x0 == 0 and x1 == width:
+            if not isinstance(args, str) and len(args) > 2 and args[2] < 0: #строки снизу вверх: пропускаем нижние
+                if not args[1]:
+                    return img.crop((0, 0, width, rows))
+                offset += (y1 - min(y1, rows)) * args[1]
+        elif not (codec == 'zip' and len(tiles) == 1): #PNG распаковывается последовательно
+            return img.crop((0, 0, width, rows))
+
+        new_tiles.append(_replace_tile(tile, (x0, y0, x1, min(y1, rows)), offset))
+
+    source = img.filename or img.fp #чтобы открыть картинку заново, если ранняя остановка не сработает
+    img.tile = new_tiles
+    img._size = (width, rows)
+    try:
+        img.load()
+        if img.size == (width, rows):
+            return img
+    except Exception: #правка тайлов опирается на внутренности PIL - при любой ошибке декодируем картинку как обычно
+        pass
+
+    return Image.open(source).crop((0, 0, width, rows))
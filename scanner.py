@@ -0,0 +1,200 @@
+"""
+Поиск картинок, в которых уже спрятано сообщение. В каждой картинке ищется заголовок SpyCats при всех degree,
+а по началу картинки считаются два дешёвых статистических теста младших битов: хи-квадрат (Вестфельд, Пфицманн)
+и анализ пар отсчётов (Думитреску, Ву, Ванг) - они замечают и чужие LSB-вставки. Подозрительной картинка считается,
+только если тесты согласны: хи-квадрат в одиночку срабатывает на любой картинке с ровной гистограммой.
+Картинки проверяются в пуле процессов, результаты выдаются по мере готовности
+"""
+
+import heapq
+import math
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageMode
+
+import batch
+import layout as layout_module
+import metrics
+import raster
+from app import Stega
+
+
+SAMPLE = 2**18 #сколько отсчётов с начала картинки декодируется для статистических тестов
+MIN_EXPECTED = 5 #пары значений, которые встречаются реже, в хи-квадрат не входят
+SUSPICIOUS = 0.5 #с такой оценки картинка считается подозрительной: у чистых bench.make_cover она не выше 0.36,
+                 #у заполненных сообщением (и заполненных на треть подряд) - не ниже 0.7
+
+
+def _chi2_sf(stat, df):
+    """P(X > stat) для распределения хи-квадрат с df степенями свободы (приближение Уилсона-Хилферти)"""
+    z = ((stat / df) ** (1 / 3) - (1 - 2 / (9 * df))) / math.sqrt(2 / (9 * df))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def chi_square(values):
+    """
+    Вероятность того, что младшие биты values заменены случайными. При встраивании частоты значений
+    2k и 2k+1 выравниваются, и статистика хи-квадрат по этим парам становится подозрительно малой
+    """
+
+    hist = np.bincount((values & 0xFF).astype(np.intp), minlength=256).astype(np.float64)
+    even, odd = hist[0::2], hist[1::2]
+    expected = (even + odd) / 2
+
+    used = expected >= MIN_EXPECTED
+    df = int(used.sum()) - 1
+    if df < 1:
+        return 0.0
+
+    stat = float(((even[used] - expected[used]) ** 2 / expected[used]).sum())
+    return _chi2_sf(stat, df)
+
+
+def sample_pairs(left, right):
+    """
+    Оценка доли отсчётов, младший бит которых занят сообщением (0 - сообщения нет, 1 - занят каждый),
+    по парам соседних отсчётов одного канала left[i], right[i]
+    """
+
+    left, right = left.astype(np.int64), right.astype(np.int64)
+    odd = (right & 1).astype(bool)
+
+    x = np.count_nonzero(np.where(odd, left > right, left < right))
+    y = np.count_nonzero(np.where(odd, left < right, left > right))
+    k = np.count_nonzero(left >> 1 == right >> 1) #пары, которые встраивание переводит друг в друга
+    if k == 0:
+        return 0.0
+
+    #доля изменённых бит beta - меньший корень 2k*b^2 + 2(2x - n)*b + (y - x) = 0; сообщение меняет половину бит
+    a, b, c = 2 * k, 2 * (2 * x - len(left)), y - x
+    disc = b * b - 4 * a * c
+    beta = (-b - math.sqrt(disc)) / (2 * a) if disc >= 0 else -b / (2 * a)
+
+    return float(min(max(2 * beta, 0.0), 1.0))
+
+
+def combined(chi, pairs):
+    """Общая оценка двух тестов - среднее геометрическое: высокая, только если высоки обе"""
+    return math.sqrt(chi * pairs)
+
+
+def _head(path, sample, channels=None):
+    """
+    Первые строки картинки (не меньше sample отсчётов) как массив (строки, ширина, каналы)
+    из каналов, которые занимает Stega с этими channels (по умолчанию все, кроме альфы)
+    """
+
+    img = Image.open(path)
+    mode = layout_module.native_mode(img.mode, img.info)
+    bands = np.unique(layout_module.Layout(mode, 1, channels).band)
+
+    width = img.size[0]
+    img = raster.decode_rows(img, -(-sample // (width * len(ImageMode.getmode(mode).bands))))
+    if img.mode != mode:
+        img = img.convert(mode)
+
+    return np.array(img).reshape(img.size[1], width, -1)[:, :, bands]
+
+
+def scan_image(job):
+    """
+    Проверяет одну картинку (выполняется в процессе пула). Поля job: path, необязательные key, channels, sample, stats.
+    Исключения не выбрасываются, а попадают в результат
+    """
+
+    result = {'path': job['path'], 'status': 'ok'}
+    started = time.perf_counter()
+    meter = metrics.Metrics() if job.get('stats') else metrics.NULL
+
+    try:
+        with meter.span('probe'):
+            headers = Stega(metrics=meter).probe(job['path'], job.get('key'), job.get('channels'))
+
+        with meter.span('statistics'):
+            head = _head(job['path'], job.get('sample') or SAMPLE, job.get('channels'))
+            chi = chi_square(head.reshape(-1))
+            pairs = sample_pairs(head[:, :-1].reshape(-1), head[:, 1:].reshape(-1))
+
+        score = 1.0 if headers else combined(chi, pairs)
+        result.update({
+            'verdict': 'spycats' if headers else 'suspicious' if score >= SUSPICIOUS else 'clean',
+            'score': round(score, 4),
+            'chi_square': round(chi, 4),
+            'sample_pairs': round(pairs, 4),
+            'headers': headers,
+        })
+
+        if meter.enabled:
+            result['metrics'] = meter.snapshot()
+
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    result['seconds'] = round(time.perf_counter() - started, 6)
+    return result
+
+
+def iter_images(paths):
+    """Пути картинок: файлы как есть, каталоги обходятся рекурсивно"""
+
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in batch.IMAGE_EXTENSIONS:
+                    yield os.path.join(root, name)
+
+
+def scan(paths, workers=None, in_flight=None, key=None, channels=None, sample=SAMPLE, stats=False):
+    """Проверяет картинки и каталоги paths в пуле процессов; результаты scan_image выдаются по мере готовности"""
+
+    jobs = ({'path': path, 'key': key, 'channels': channels, 'sample': sample, 'stats': stats}
+            for path in iter_images(paths))
+    return batch.run_batch(jobs, workers, in_flight, func=scan_image)
+
+
+class Ranking():
+    """
+    Итог проверки: сколько картинок в каждой категории и top самых подозрительных
+    (в памяти держатся только они, так что каталог может быть любого размера)
+    """
+
+    def __init__(self, top=20):
+        self.top = top
+        self.failed = 0
+        self.verdicts = {'spycats': 0, 'suspicious': 0, 'clean': 0}
+        self.__heap = [] #(оценка, номер, результат) - наименее подозрительная из лучших наверху
+        self.__count = 0
+
+    def add(self, result):
+        if result['status'] != 'ok':
+            self.failed += 1
+            return
+
+        self.verdicts[result['verdict']] += 1
+        self.__count += 1
+        item = (result['score'], self.__count, result)
+        if len(self.__heap) < self.top:
+            heapq.heappush(self.__heap, item)
+        elif self.top:
+            heapq.heappushpop(self.__heap, item)
+
+    def ranked(self):
+        """Самые подозрительные результаты по убыванию оценки"""
+        return [result for _, _, result in sorted(self.__heap, key=lambda item: (-item[0], item[1]))]
+
+    def summary(self):
+        lines = [f'с заголовком SpyCats: {self.verdicts["spycats"]}, подозрительных: {self.verdicts["suspicious"]}, '
+                 f'чистых: {self.verdicts["clean"]}, ошибок: {self.failed}']
+        for result in self.ranked():
+            if result['verdict'] == 'clean':
+                break
+            lines.append(f'{result["score"]:.3f} {result["verdict"]:<10} {result["path"]}')
+        return '\n'.join(lines)
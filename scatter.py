@@ -0,0 +1,87 @@
+"""
+Псевдослучайный порядок байтов картинки, задаваемый ключом. Перестановка строится как сеть Фейстеля
+над индексами (с "прогулкой по циклу" для выхода за диапазон), поэтому первые N позиций
+вычисляются за O(N) одной векторной операцией, без перемешивания всего массива индексов
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+ROUNDS = 4
+CACHE_SIZE = 8 #сколько перестановок (ключ, размер картинки) держать в памяти
+CACHE_BYTES = 64 * 2**20 #и сколько памяти они вместе занимают; более длинное начало перестановки не кэшируется
+
+_cache = OrderedDict() #(хэш ключа, число байтов картинки): уже вычисленное начало перестановки
+
+
+def _digest(key):
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return hashlib.sha256(b'SpyCats scatter\0' + bytes(key)).digest()
+
+
+def _mix(z):
+    """Перемешивание 64-битных чисел (финализатор splitmix64)"""
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return z ^ (z >> np.uint64(31))
+
+
+def _feistel(x, half, round_keys):
+    """Биекция на [0, 2**(2*half)): несколько раундов сети Фейстеля над половинами индекса"""
+
+    mask = np.uint64((1 << half) - 1)
+    shift = np.uint64(half)
+    left, right = x >> shift, x & mask
+
+    for round_key in round_keys:
+        left, right = right, left ^ (_mix(right ^ round_key) & mask)
+
+    return (left << shift) | right
+
+
+def _permute(digest, total, start, stop, dtype=np.int64):
+    """Позиции перестановки [0, total) с номерами от start до stop (массив типа dtype)"""
+
+    half = max(1, ((total - 1).bit_length() + 1) // 2)
+    round_keys = [np.uint64(int.from_bytes(digest[8 * i:8 * i + 8], 'little')) for i in range(ROUNDS)]
+
+    out = _feistel(np.arange(start, stop, dtype=np.uint64), half, round_keys)
+    outside = np.flatnonzero(out >= total)
+    while len(outside): #прогулка по циклу: повторяем перестановку, пока не попадём в [0, total)
+        out[outside] = _feistel(out[outside], half, round_keys)
+        outside = outside[out[outside] >= total]
+
+    return out.astype(dtype)
+
+
+def positions(key, total, count):
+    """
+    Первые count позиций псевдослучайной перестановки байтов картинки [0, total), заданной ключом key.
+    Результат кэшируется для пары (ключ, total) и при запросе большего count только дописывается
+    """
+
+    if count > total:
+        raise ValueError('позиций больше, чем байтов в картинке')
+
+    total = int(total)
+    cache_key = (_digest(key), total)
+    prefix = _cache.pop(cache_key, None)
+    dtype = np.uint32 if total <= 2**32 else np.int64 #в кэше позиции хранятся вдвое компактнее, если это возможно
+
+    if prefix is None or len(prefix) < count:
+        start = 0 if prefix is None else len(prefix)
+        tail = _permute(cache_key[0], total, start, count, dtype)
+        prefix = tail if prefix is None else np.concatenate([prefix, tail])
+
+    if prefix.nbytes <= CACHE_BYTES:
+        _cache[cache_key] = prefix
+        used = sum(cached.nbytes for cached in _cache.values())
+        while len(_cache) > CACHE_SIZE or used > CACHE_BYTES: #вытесняем самые старые
+            _, old = _cache.popitem(last=False)
+            used -= old.nbytes
+
+    return prefix[:count].astype(np.int64)
@@ -0,0 +1,95 @@
+"""
+Фоновое выполнение долгих операций Stega для GUI: задачи работают в отдельном потоке,
+а события (прогресс, результат, ошибка) складываются в очередь, которую окно опрашивает через after()
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Cancelled(Exception):
+    """Задача отменена пользователем"""
+
+
+class Task():
+    """
+    Одна фоновая задача. on_done и on_error вызываются в потоке окна из Worker.poll()
+    """
+
+    def __init__(self, name, on_done=None, on_error=None):
+        self.name = name
+        self.on_done = on_done
+        self.on_error = on_error
+        self.__cancel = threading.Event()
+
+    def cancel(self):
+        self.__cancel.set()
+
+    @property
+    def cancelled(self):
+        return self.__cancel.is_set()
+
+
+class Worker():
+    """
+    Выполняет задачи по одной в фоновом потоке. Функция задачи получает аргумент progress(stage, done, total);
+    каждый его вызов отправляет событие в очередь и прерывает задачу, если её отменили
+    """
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stega')
+        self.__tasks = set()
+
+    def submit(self, name, func, *args, on_done=None, on_error=None, **kwargs):
+        """Ставит func(*args, progress=..., **kwargs) в очередь и возвращает Task"""
+
+        task = Task(name, on_done, on_error)
+        self.__tasks.add(task)
+
+        def progress(stage, done=None, total=None):
+            if task.cancelled:
+                raise Cancelled()
+            self.events.put(('progress', task, (stage, done, total)))
+
+        def run():
+            try:
+                if task.cancelled:
+                    raise Cancelled()
+                result = func(*args, progress=progress, **kwargs)
+            except Cancelled:
+                self.events.put(('cancelled', task, None))
+            except Exception as e:
+                self.events.put(('error', task, e))
+            else:
+                self.events.put(('done', task, result))
+
+        self.__executor.submit(run)
+        return task
+
+    def cancel_all(self):
+        for task in self.__tasks:
+            task.cancel()
+
+    @property
+    def busy(self):
+        return bool(self.__tasks)
+
+    def poll(self):
+        """Забирает накопившиеся события без ожидания. Вызывать из потока окна"""
+
+        events = []
+        while True:
+            try:
+                kind, task, value = self.events.get_nowait()
+            except queue.Empty:
+                return events
+
+            if kind != 'progress':
+                self.__tasks.discard(task)
+            events.append((kind, task, value))
+
+    def shutdown(self):
+        self.cancel_all()
+        self.__executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,100 @@
+"""
+Сохранение закодированной картинки. Подходят только форматы без потерь: JPEG и подобные
+меняют младшие биты пикселей и уничтожают сообщение. Профиль задаёт, что важнее - скорость записи
+или размер файла
+"""
+
+import os
+
+from PIL import Image, features
+
+
+# Форматы без потерь и режимы, пиксели которых они сохраняют в точности.
+# Режим I (32 бита) PNG и PPM хранят 16-битным - годится, только если все отсчёты в его пределах
+LOSSLESS = {
+    'PNG': ('L', 'LA', 'RGB', 'RGBA', 'I;16', 'I'),
+    'TIFF': ('L', 'LA', 'RGB', 'RGBA', 'I;16', 'I'),
+    'BMP': ('L', 'RGB'),
+    'PPM': ('L', 'RGB', 'I;16', 'I'),
+    'TGA': ('L', 'LA', 'RGB', 'RGBA'),
+    'WEBP': ('RGB', 'RGBA'), #только с lossless=True и exact=True - их задают профили
+}
+
+WIDE_16 = ('PNG', 'PPM') #форматы, в которых режим I хранится 16-битным
+
+_DEFLATE = 'tiff_adobe_deflate' if features.check('libtiff') else 'raw' #сжатие TIFF возможно только с libtiff
+
+# Параметры PIL для каждого формата в каждом профиле
+PROFILES = {
+    'fastest': { #наименьшее время записи: PNG почти без сжатия, TIFF и TGA без сжатия
+        'PNG': {'compress_level': 1},
+        'TIFF': {'compression': 'raw'},
+        'TGA': {'compression': None},
+        'WEBP': {'lossless': True, 'exact': True, 'method': 0},
+    },
+    'balanced': { #настройки PIL по умолчанию
+        'PNG': {'compress_level': 6},
+        'TIFF': {'compression': 'raw'},
+        'TGA': {'compression': None},
+        'WEBP': {'lossless': True, 'exact': True, 'method': 4},
+    },
+    'smallest': { #наименьший файл: перебор фильтров PNG, deflate в TIFF, самое долгое сжатие WEBP
+        'PNG': {'optimize': True},
+        'TIFF': {'compression': _DEFLATE},
+        'TGA': {'compression': 'tga_rle'},
+        'WEBP': {'lossless': True, 'exact': True, 'method': 6, 'quality': 100},
+    },
+}
+
+
+def format_for(out, format=None):
+    """Формат, в котором картинка запишется в out: заданный явно, по расширению пути или PNG для файлового объекта"""
+
+    if format is not None:
+        return format.upper()
+    if not isinstance(out, (str, os.PathLike)):
+        return 'PNG'
+
+    ext = os.path.splitext(os.fspath(out))[1].lower()
+    format = Image.registered_extensions().get(ext)
+    if format is None:
+        raise ValueError(f'не удалось определить формат картинки по расширению "{ext}"')
+    return format
+
+
+def check(format, mode=None):
+    """Проверяет, что format сохранит младшие биты картинки в режиме mode (без mode - хоть в каком-то режиме)"""
+
+    if format not in LOSSLESS:
+        raise ValueError(f'формат {format} не сохраняет пиксели в точности и уничтожит сообщение, '
+                         f'выберите один из {sorted(LOSSLESS)}')
+    if mode is not None and mode not in LOSSLESS[format]:
+        raise ValueError(f'формат {format} не сохраняет без потерь картинки в режиме {mode}, '
+                         f'подходят {", ".join(LOSSLESS[format])}')
+
+
+def save(img, out, format=None, profile='balanced', **params):
+    """
+    Сохраняет картинку в путь или файловый объект out с параметрами профиля profile ('fastest', 'balanced',
+    'smallest'); params дополняют и перекрывают их. Форматы с потерями не принимаются
+    """
+
+    if profile not in PROFILES:
+        raise ValueError(f'неизвестный профиль сохранения: {profile}, есть {", ".join(PROFILES)}')
+
+    format = format_for(out, format)
+    check(format, img.mode)
+
+    options = dict(PROFILES[profile].get(format, {}))
+    options.update(params)
+
+    if img.mode == 'I' and format in WIDE_16:
+        low, high = img.getextrema()
+        if low < 0 or high > 0xFFFF: #при записи в 16 бит такие отсчёты обрезались бы вместе с сообщением
+            raise ValueError(f'формат {format} хранит не больше 16 бит на отсчёт, а в картинке есть значения '
+                             f'от {low} до {high}: сохраните её в TIFF')
+        if format == 'PNG':
+            img = img.convert('I;16')
+
+    img.save(out, format=format, **options)
+    return out